@@ -1,30 +1,39 @@
 from Nodes.CoreObject import NObject
-from Nodes.WeakReferences import NWeakRef, NWeakMethod
+from Nodes.WeakReferences import NWeakRef, NWeakMethod, objectRef
 from Nodes import CoreUtils
 from Nodes.Decorators import *
 from Nodes.CoreProperties import *
 import global_accessor as GA
+from Nodes.CoreLog import LOG
 import warnings
 
 
 class BoundMethod(object):
+    __slots__ = ('__PropFlags__', '__PropHooks__', '__PropGetters__',
+                 '_owningDelegate', '_Owner', '_ObjectRef', '_FuncRef', '_FuncName', '_indexKeys', '__weakref__')
+
     def __init__(self, owning_del=None, owner=None, o=None, fname='', fRef=None):
         CLASS_BODY(self)
 
         NATTR(self, '_owningDelegate', EAttrType.AT_Serializable)
-        self._owningDelegate = NWeakRef(owning_del)
+        self._owningDelegate = objectRef(owning_del)
 
         NATTR(self, '_Owner', EAttrType.AT_Serializable)
-        self._Owner = NWeakRef(owner)
+        self._Owner = objectRef(owner)
 
         NATTR(self, '_ObjectRef', EAttrType.AT_Serializable)
-        self._ObjectRef = NWeakRef(o)
+        self._ObjectRef = objectRef(o)
+        if isinstance(o, NObject):
+            o._trackConnection(self)
 
-        self._FuncRef = NWeakMethod(fRef)
+        self._FuncRef = self._watch(fRef) if fRef else None
 
         NATTR(self, 'FuncName', EAttrType.AT_Serializable)
         self._FuncName = fname
 
+        # Keys this connection is registered under in its delegate's index.
+        self._indexKeys = ()
+
 
     def call(self, ResultStatus, *args, **kwargs):
         if self._FuncRef:
@@ -38,6 +47,13 @@ class BoundMethod(object):
     def getFuncName(self):
         return self._FuncName
 
+    def getFuncRef(self):
+        """
+        Get a hard reference to the bound function.
+        :return: The bound method or function, None if its target is dead.
+        """
+        return self._FuncRef() if self._FuncRef else None
+
     def getLinkedObject(self):
         return self._ObjectRef()
 
@@ -51,11 +67,28 @@ class BoundMethod(object):
         """
         Kill this connection and remove it from the delegate.
         """
-        print('Disconnecting %s' % str(self))
+        if LOG.bDebug:
+            LOG.debug('Disconnecting %s', self)
         self._owningDelegate().removeFunction(self)
 
+    def _watch(self, func):
+        """
+        Weakly reference a bound function, removing this connection from its delegate as soon as the function's object dies.
+        """
+        # The callback only holds a weak reference to this object, so it doesn't keep the connection alive.
+        selfRef = NWeakRef(self)
+
+        def onDead(ref):
+            bm = selfRef()
+            if bm is not None:
+                bm._onConnectionDead(ref)
+
+        return NWeakMethod(func, onDead)
+
     def _onConnectionDead(self, weakRef):
-        self._owningDelegate().connectionDied(self)
+        delegate = self._owningDelegate() if self._owningDelegate else None
+        if delegate is not None:
+            delegate.connectionDied(self)
 
     def __archive__(self, Ar):
         # print('BOUND METHOD OBJECTS', self._Owner, self._ObjectRef, self._owningDelegate)
@@ -71,35 +104,40 @@ class BoundMethod(object):
         ownerObj = GA.getInstance(data[0])
         linkedObj = GA.getInstance(data[1])
         owningDel = GA.getInstance(data[2])
-        self._Owner = NWeakRef(ownerObj) if ownerObj else None
-        self._ObjectRef = NWeakRef(linkedObj) if linkedObj else None
-        self._owningDelegate = NWeakRef(owningDel) if owningDel else None
+        self._Owner = objectRef(ownerObj) if ownerObj else None
+        self._ObjectRef = objectRef(linkedObj) if linkedObj else None
+        self._owningDelegate = objectRef(owningDel) if owningDel else None
+        if isinstance(linkedObj, NObject):
+            linkedObj._trackConnection(self)
 
         funcObj = getattr(self._ObjectRef(), data[3], None)
 
-        self._FuncRef = NWeakMethod(funcObj) if funcObj else None
+        self._FuncRef = self._watch(funcObj) if funcObj else None
         pass
 
     def __jsonSerialize__(self, Serial: dict):
-        Serial['owner'] = self._Owner().getUUID() if self._Owner and self._Owner.isValid() else "None"
-        Serial['owningDel'] = self._owningDelegate().getUUID()
-        Serial['tgtObj'] = self._ObjectRef().getUUID() if self._ObjectRef and self._ObjectRef.isValid() else "None"
+        Serial['owner'] = self._Owner().getUUID().toString() if self._Owner and self._Owner.isValid() else "None"
+        Serial['owningDel'] = self._owningDelegate().getUUID().toString()
+        Serial['tgtObj'] = self._ObjectRef().getUUID().toString() if self._ObjectRef and self._ObjectRef.isValid() else "None"
         Serial['tgtFunc'] = self._FuncName
 
     def __jsonReader__(self, myDict: dict):
         ownerObj = GA.getInstance(myDict['owner'])
         linkedObj = GA.getInstance(myDict['tgtObj'])
         owningDel = GA.getInstance(myDict['owningDel'])
-        self._Owner = NWeakRef(ownerObj) if ownerObj else None
-        self._ObjectRef = NWeakRef(linkedObj) if linkedObj else None
-        self._owningDelegate = NWeakRef(owningDel) if owningDel else None
+        self._Owner = objectRef(ownerObj) if ownerObj else None
+        self._ObjectRef = objectRef(linkedObj) if linkedObj else None
+        self._owningDelegate = objectRef(owningDel) if owningDel else None
+        if isinstance(linkedObj, NObject):
+            linkedObj._trackConnection(self)
 
         funcObj = getattr(self._ObjectRef(), myDict['tgtFunc'], None)
 
-        self._FuncRef = NWeakMethod(funcObj) if funcObj else None
+        self._FuncRef = self._watch(funcObj) if funcObj else None
 
     def __del__(self):
-        print("Destroying %s" % str(self))
+        if LOG.bDebug:
+            LOG.debug("Destroying %s", self)
 
 
 class Delegate(NObject):
@@ -114,10 +152,18 @@ class Delegate(NObject):
         super(Delegate, self).__init__(world=Owner.getWorld() if Owner else None, name=name, owner=Owner, UseHardRef=True)
 
         NATTR(self, '_functions', EAttrType.AT_Serializable)
-        self._functions = NArray(BoundMethod)
+        self._functions = NOrderedSet(BoundMethod)
 
         self._mode = kwargs.get('mode', 0)  # Can be 0 or 1. If mode is 1, Delegate will be destroyed once all functions are cleared.
 
+        # Pre-resolved callables installed by an NExecutionPlan. When not None, dispatch bypasses the BoundMethod objects.
+        self._compiled = None
+        # Weak references to the bound functions, in binding order. Rebuilt on the first dispatch after the bindings change.
+        self._calls = None
+        # (target id, function name) and (target id, function) -> {BoundMethod: None}, in binding order. Used by findFunc.
+        self._index = {}
+        # Incremented every time the bindings change, so compiled plans can detect they went stale.
+        self._revision = 0
 
     def bindFunction(self, *args):
         """
@@ -150,6 +196,9 @@ class Delegate(NObject):
         if bError:
             raise TypeError("{input} is not a function type or NObject reference, or the passed-in function name is not valid.".format(input=str(args[0])))
 
+        self._addToIndex(new)
+        self._bindingsChanged()
+
         if len(args) == 3 and isinstance(args[2], NStatus):
             args[2].set(EStatus.kSuccess if not bError else EStatus.kError)
 
@@ -164,7 +213,9 @@ class Delegate(NObject):
         bError = False
         BoundFunc = self.findFunc(*args) if not isinstance(args[0], BoundMethod) else args[0]
         if BoundFunc:
+            self._removeFromIndex(BoundFunc)
             self._functions.remove(BoundFunc)
+            self._bindingsChanged()
         else:
             bError = True
 
@@ -177,20 +228,21 @@ class Delegate(NObject):
                 pass
 
     def execute(self, *args, **kwargs):
-        garbageFunctions = []
-        for func in self._functions:
-            Status = NStatus()
-            func.call(Status, *args, **kwargs)
-
-            if Status.get() != EStatus.kSuccess:
-                garbageFunctions.append(func)
-
-        for idx in range(len(garbageFunctions)).__reversed__():
-            item = garbageFunctions.pop(idx)
-            del item
-
+        if self._compiled is not None:
+            for call in self._compiled:
+                call(*args, **kwargs)
+            return
+
+        bDead = False
+        for ref in self._liveCalls():
+            func = ref()
+            if func is not None:
+                func(*args, **kwargs)
+            else:
+                bDead = True
 
-        return
+        if bDead:
+            self.pruneDead()
 
     def getBoundFunctions(self):
         """
@@ -200,30 +252,134 @@ class Delegate(NObject):
         return [NWeakRef(func) for func in self._functions]
 
     def findFunc(self, funcNameOrObj, obj=None):
-        for bm in self._functions:
-            if isinstance(funcNameOrObj, str):
-                if bm.getFuncName() == funcNameOrObj:
-                    if obj is not None:
-                        if bm.getLinkedObject() == obj:
-                            return bm
-                    else:
-                        raise RuntimeError("Passed-in function is a string, but no owning object reference was passed for it.")
-
-            elif callable(funcNameOrObj):
-                if bm.getFuncRef() == funcNameOrObj:
-                    return bm
+        """
+        Find the connection of a function.
+        :param funcNameOrObj: Either the function, or its name, in which case obj must be given.
+        :param obj: The object the function is bound to, when funcNameOrObj is a name.
+        :return: The first matching BoundMethod, None if there is none.
+        """
+        if isinstance(funcNameOrObj, str):
+            if obj is None:
+                raise RuntimeError("Passed-in function is a string, but no owning object reference was passed for it.")
+            key = (id(obj), funcNameOrObj)
+
+        elif callable(funcNameOrObj):
+            key = Delegate._funcKey(funcNameOrObj)
 
+        else:
+            raise TypeError("Input param 1 is not callable and is not a string.")
+
+        entries = self._index.get(key, None)
+        return next(iter(entries)) if entries else None
+
+    @staticmethod
+    def _funcKey(func):
+        return id(getattr(func, '__self__', None)), getattr(func, '__func__', func)
+
+    def _addToIndex(self, bm: BoundMethod):
+        obj = bm.getLinkedObject() if bm._ObjectRef else None
+        func = bm.getFuncRef()
+        bm._indexKeys = ((id(obj), bm.getFuncName()),) + ((Delegate._funcKey(func),) if func is not None else ())
+        for key in bm._indexKeys:
+            entries = self._index.get(key, None)
+            if entries is None:
+                self._index[key] = {bm: None}
             else:
-                raise TypeError("Input param 1 is not callable and is not a string.")
+                entries[bm] = None
+
+    def _removeFromIndex(self, bm: BoundMethod):
+        if not bm._indexKeys:
+            return
+
+        for key in bm._indexKeys:
+            entries = self._index.get(key, None)
+            if entries is not None:
+                entries.pop(bm, None)
+                if not entries:
+                    del self._index[key]
 
-        return None
+        bm._indexKeys = ()
+
+    def _rebuildIndex(self):
+        """
+        Index every connection from scratch. Called after the connections were read back into the array directly, as done when deserializing.
+        """
+        self._index.clear()
+        for bm in self._functions:
+            self._addToIndex(bm)
+
+    def _liveCalls(self):
+        calls = self._calls
+        if calls is None:
+            calls = self._calls = tuple(bm._FuncRef for bm in self._functions if bm._FuncRef is not None)
+
+        return calls
+
+    def pruneDead(self):
+        """
+        Remove the bound functions whose target was destroyed.
+        """
+        dead = [bm for bm in self._functions if bm.getFuncRef() is None]
+        for bm in dead:
+            if bm in self._functions:
+                self._removeFromIndex(bm)
+                self._functions.remove(bm)
+
+        if dead:
+            self._bindingsChanged()
 
     def connectionDied(self, connection):
-        self._functions.remove(connection)
-        print('Deleted connection %s' % str(connection))
+        # The connection may already be gone, if it was pruned or removed before its target was collected.
+        if connection in self._functions:
+            self._removeFromIndex(connection)
+            self._functions.remove(connection)
+            self._bindingsChanged()
+            if LOG.bDebug:
+                LOG.debug('Deleted connection %s', connection)
 
     def clearAll(self):
         self._functions.clear()
+        self._index.clear()
+        self._bindingsChanged()
+
+    def destroy(self):
+        super(Delegate, self).destroy()
+        self.clearAll()
+
+    def compile(self):
+        """
+        Resolve every bound function to a hard method reference, skipping dead ones.
+        :return: A tuple of callables that can be installed with setCompiled().
+        """
+        calls = []
+        for func in self._functions:
+            ref = func.getFuncRef()
+            if ref is not None:
+                calls.append(ref)
+
+        return tuple(calls)
+
+    def setCompiled(self, calls):
+        """
+        Install (or remove, with None) a tuple of pre-resolved callables used instead of the BoundMethod dispatch.
+        :param calls: The tuple returned by compile(), or None.
+        """
+        self._compiled = calls
+
+    def revision(self):
+        return self._revision
+
+    def _bindingsChanged(self):
+        self._compiled = None
+        self._calls = None
+        self._revision += 1
+
+    def __binaryreader__(self, data: (list, tuple)):
+        res = super(Delegate, self).__binaryreader__(data)
+        # The connections were read back into the array directly.
+        self._rebuildIndex()
+        self._bindingsChanged()
+        return res
 
     def __jsonSerialize__(self, Serial: dict):
         Serial['name'] = self._name.toString()
@@ -263,7 +419,10 @@ class DelegateSingle(Delegate):
         self.clear()
 
     def clear(self):
-        del self._functions[0]
+        bm = self._functions[0]
+        self._removeFromIndex(bm)
+        self._functions.remove(bm)
+        self._bindingsChanged()
 
 
 class DelegateMulticast(Delegate):
@@ -280,16 +439,20 @@ class CollectorSingle(DelegateSingle):
         pass
 
     def call(self, *args, **kwargs):
-        if len(self._functions) != 0:
-            status = NStatus()
-            res = self._functions[0].call(status, *args, **kwargs)
-            if not status.isError():
-                return res
-            else:
-                del self._functions[0]
-                return None
+        if self._compiled:
+            return self._compiled[0](*args, **kwargs)
+
+        calls = self._liveCalls()
+        if calls:
+            func = calls[0]()
+            if func is not None:
+                return func(*args, **kwargs)
+
+            self.pruneDead()
+            return None
         else:
-            print("{0} was called but is not bound to any function.".format(self.getName()))
+            if LOG.bWarning:
+                LOG.warning("%s was called but is not bound to any function.", self.getName())
 
     def isBound(self):
         return len(self._functions) != 0
@@ -297,18 +460,19 @@ class CollectorSingle(DelegateSingle):
 
 class CollectorMulticast(Delegate):
     def execute(self, *args, **kwargs):
+        if self._compiled is not None:
+            return [call(*args, **kwargs) for call in self._compiled]
+
         results = []
-        garbage = []
-        for func in self._functions:
-            status = NStatus()
-            res = func.call(status, *args, **kwargs)
-            if not status.isError():
-                results.append(res)
+        bDead = False
+        for ref in self._liveCalls():
+            func = ref()
+            if func is not None:
+                results.append(func(*args, **kwargs))
             else:
-                garbage.append(func)
+                bDead = True
 
-        for idx in range(len(garbage)).__reversed__():
-            item = garbage.pop(idx)
-            del item
+        if bDead:
+            self.pruneDead()
 
         return results
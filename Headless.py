@@ -0,0 +1,179 @@
+"""
+Headless graph runner. Loads a saved graph and runs it on NWorld without ever importing Qt.
+Usage: python -m Headless <graph.json> [--entry NodeName] [--compiled] [--parallel]
+
+The graph file is a json document of the form:
+{
+    "nodes": [{"name": "Loop", "nodeType": ["ForLoop", 0], "inputs": {"end": 5}}, ...],
+    "connections": [{"plugNode": "Loop", "plugAttr": "loop", "socketNode": "Print", "socketAttr": "execute"}, ...],
+    "entry": "Loop"
+}
+"nodeType" matches NFunctionBase.classInfo(). "inputs" is optional and holds values for NDynamicAttrs or @Property inputs.
+
+The graph file can also be an archive file written by HEADLESS.saveArchive(). Only the nodes that are asked for with --only are then
+created and read, straight from the archive's table of contents, along with the connections between them. Archive files have no
+entry node: pass it with --entry.
+"""
+import sys, os, json, argparse
+
+from NodeLibraries import DEPENDENCY_LIST
+from Nodes import Core
+from Nodes.CoreProperties import NArchiveFile
+from Nodes.FuncNodes import NFunctionWrapper
+import global_accessor as g_a
+
+
+class HEADLESS(Core.NWorld):
+    def __init__(self):
+        # Named like the Ui application, since configuration lookups resolve the application path by this name.
+        super(HEADLESS, self).__init__(name='APPLICATION')
+
+        Core.NWorld.registerLibraries(DEPENDENCY_LIST)
+        self._nodes = {}
+        # (plug node name, plug attribute, socket node name, socket attribute) of the connections made by connectNodes().
+        self._connections = []
+        self._entryName = None
+
+    @property
+    def path(self):
+        return os.path.realpath(os.path.dirname(__file__))
+
+    def getNode(self, name: str):
+        return self._nodes.get(name, None)
+
+    def spawnNode(self, name: str, nodeType: (list, tuple)):
+        """
+        Create a node from its class info.
+        :param name: The name to give the new node.
+        :param nodeType: The class info, as returned by NFunctionBase.classInfo().
+        :return: The new node.
+        """
+        cls = g_a.functionClasses.get(nodeType[0], None)
+        if nodeType[0] == NFunctionWrapper.__name__:
+            funcObj = g_a.functionClasses.get(nodeType[1], None)
+            if funcObj is None:
+                raise RuntimeError("%s is not registered. Cannot load the graph." % nodeType[1])
+
+            node = NFunctionWrapper(name, funcObj)
+
+        elif cls is not None:
+            node = cls(name)
+
+        else:
+            raise RuntimeError("%s is not registered. Cannot load the graph." % nodeType[0])
+
+        self._nodes[name] = node
+        return node
+
+    def connectNodes(self, plugName: str, plugAttr: str, socketName: str, socketAttr: str):
+        Core.NWorld.connectNodes(self._nodes[plugName], plugAttr, self._nodes[socketName], socketAttr)
+        self._connections.append((plugName, plugAttr, socketName, socketAttr))
+
+    @staticmethod
+    def setInput(node, prop: str, value):
+        attr = getattr(node, prop)
+        if isinstance(attr, Core.NDynamicAttr):
+            attr.set(value)
+        elif callable(attr):
+            attr(value)
+        else:
+            setattr(node, prop, value)
+
+    def loadGraph(self, filePath: str, names: (list, tuple) = None):
+        """
+        Load a json graph, or the nodes of an archive file.
+        :param names: Names of the nodes to load from an archive file, all of them if None. Ignored for json graphs.
+        """
+        if NArchiveFile.isArchiveFile(filePath):
+            self.loadArchive(filePath, names)
+            return
+
+        with open(filePath, 'r') as f:
+            data = json.load(f)
+
+        for item in data['nodes']:
+            node = self.spawnNode(item['name'], item['nodeType'])
+            if item.get('nodeData', None):
+                node.__jsonReader__(item['nodeData'])
+                node.update()
+
+            for prop, value in item.get('inputs', {}).items():
+                HEADLESS.setInput(node, prop, value)
+
+        for c in data.get('connections', []):
+            self.connectNodes(c['plugNode'], c['plugAttr'], c['socketNode'], c['socketAttr'])
+
+        self._entryName = data.get('entry', None)
+
+    def loadArchive(self, filePath: str, names: (list, tuple) = None):
+        """
+        Create nodes from an archive file. Only the table of contents and the chunks of the requested nodes are read.
+        The connections between the loaded nodes are restored, those leading to nodes that were not loaded are left out.
+        :param names: Names of the nodes to load, all of them if None.
+        :return: The loaded nodes.
+        """
+        with open(filePath, 'rb') as f, NArchiveFile.open(f) as archive:
+            if names is None:
+                uuids = archive.getEntries()
+            else:
+                uuids = []
+                for name in names:
+                    found = archive.findByName(name)
+                    if not found:
+                        raise RuntimeError("No node named %s in %s." % (name, filePath))
+                    uuids.extend(found)
+
+            loaded = {uuid: archive.loadObject(uuid, self.spawnNode) for uuid in uuids}
+            for source, sourceAttr, target, targetAttr in archive.getLinks():
+                if source in loaded and target in loaded:
+                    self.connectNodes(loaded[source].getName().toString(), sourceAttr, loaded[target].getName().toString(), targetAttr)
+
+        return list(loaded.values())
+
+    def saveArchive(self, filePath: str):
+        """
+        Write the loaded nodes and their connections to an archive file, replacing it atomically.
+        """
+        archive = NArchiveFile()
+        for node in self._nodes.values():
+            archive.add(node)
+
+        for plugName, plugAttr, socketName, socketAttr in self._connections:
+            archive.addLink(self._nodes[plugName].getUUID(), plugAttr, self._nodes[socketName].getUUID(), socketAttr)
+
+        archive.save(filePath, bAtomic=True)
+
+    def run(self, entryName: str = None, bCompiled: bool = False):
+        name = entryName if entryName else self._entryName
+        node = self.getNode(name)
+        if node is None:
+            raise RuntimeError("No entry node named %s in the loaded graph." % name)
+
+        if bCompiled:
+            self.compile(node).run()
+        else:
+            node.execute()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='Headless', description="Run a NodeProcess graph without interface.")
+    parser.add_argument('graph', help="Path to the graph file.")
+    parser.add_argument('--entry', default=None, help="Name of the node to execute. Defaults to the graph's entry.")
+    parser.add_argument('--only', nargs='+', default=None, help="Names of the nodes to load from an archive file. Defaults to all of them.")
+    parser.add_argument('--compiled', action='store_true', help="Run through a compiled execution plan.")
+    parser.add_argument('--parallel', action='store_true', help="Run independent branches concurrently. Implies --compiled.")
+    args = parser.parse_args(argv)
+
+    world = HEADLESS()
+    world.setParallel(args.parallel)
+    world.loadGraph(args.graph, args.only)
+    try:
+        world.run(args.entry, args.compiled or args.parallel)
+    finally:
+        world.setParallel(False)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
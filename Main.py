@@ -6,30 +6,14 @@ from PySide2 import QtWidgets
 if __name__ == "__main__":
     lp = __file__.rsplit("/", 1)[0]; sys.path.extend([lp, lp.replace("/", "\\")]); del lp
 
-# Dependencies for Visual Scripting
-from Nodes import FuncNodes
-from MayaLib import MayaNodes
-from NukeLib import NukeNodes
-from RenderingLib import UtilsNodes
+from NodeLibraries import DEPENDENCY_LIST
 
 from Windows import NWindows as Win
 from Nodes import Core, CoreUtils
+from Nodes.CoreLog import LOG
 from NThreads import NThreading
 import global_accessor as g_a
-import threading, types
-
-
-
-"""
-# =============================================================================================
-                Define all modules to be used in the nodal system here.
-# =============================================================================================
-"""
-DEPENDENCY_LIST = [FuncNodes, MayaNodes, NukeNodes, UtilsNodes]
-
-
-
-
+import threading
 
 
 
@@ -43,18 +27,7 @@ class APPLICATION(Core.NWorld):
 
     @staticmethod
     def registerFunctions():
-        all_ = {}
-        for lib in DEPENDENCY_LIST:
-            all_.update(lib.__dict__)
-
-        for k, cls in all_.items():
-            if CoreUtils.UCoreUtils.checkBases(cls, Core.NFunctionBase):
-                if not getattr(cls, 'NO_DISPLAY', False):
-                    g_a.registerFunction(cls)
-
-            elif callable(cls) and isinstance(cls, types.FunctionType):
-                if getattr(cls, '__VisibleFunc__', False):
-                    g_a.registerFunction(cls)
+        Core.NWorld.registerLibraries(DEPENDENCY_LIST)
 
 
     @property
@@ -66,7 +39,8 @@ class APPLICATION(Core.NWorld):
         self._WindowReference = Win.NMainWindow(self)
         self._setGraph(self._WindowReference.graphicsView)
         self._WindowReference.show()
-        print("Spawning interface, thread ID: %s" % threading.get_ident())
+        if LOG.bInfo:
+            LOG.info("Spawning interface, thread ID: %s", threading.get_ident())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+import asyncio, subprocess, threading, traceback, sys
+from Nodes.CoreLog import LOG
+
+
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+
+# Exit code reported for processes that could not be launched.
+SPAWN_FAILED = -1
+
+
+class NEventLoop(object):
+    """
+    Runs an asyncio event loop on a single background thread, used to launch and wait on external processes.
+    Any number of processes can be in flight without holding one thread each. An optional limit caps how many run at once,
+    the others wait in the loop until a slot frees up.
+    """
+    def __init__(self, maxJobs=0):
+        self._maxJobs = maxJobs
+        self._semaphore = None
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def setMaxJobs(self, v: int):
+        """
+        Set how many processes may run at once. 0 means no limit. Jobs already waiting keep the previous limit.
+        """
+        self._maxJobs = max(int(v), 0)
+        self._semaphore = None
+
+    def getMaxJobs(self):
+        return self._maxJobs
+
+    def _ensureRunning(self):
+        with self._lock:
+            if self._loop is None:
+                # Subprocesses need a proactor loop on Windows, which isn't the default loop before Python 3.8.
+                self._loop = asyncio.ProactorEventLoop() if sys.platform == 'win32' else asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._run, name='NEventLoop', daemon=True)
+                self._thread.start()
+
+            return self._loop
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def _getSemaphore(self):
+        # Only called from the loop thread.
+        if self._maxJobs > 0 and self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._maxJobs)
+
+        return self._semaphore if self._maxJobs > 0 else None
+
+    def runProcess(self, args: (list, tuple), callback=None, **kwargs):
+        """
+        Launch a process from the event loop.
+        :param args: The program and its arguments.
+        :param callback: Optional function receiving the exit code, SPAWN_FAILED if the process could not be launched.
+            It is called from the loop thread.
+        :param kwargs: Extra arguments for asyncio.create_subprocess_exec.
+        :return: A concurrent.futures.Future resolving to the exit code.
+        """
+        loop = self._ensureRunning()
+        return asyncio.run_coroutine_threadsafe(self._runProcess(args, callback, kwargs), loop)
+
+    async def _runProcess(self, args, callback, kwargs):
+        semaphore = self._getSemaphore()
+        try:
+            if semaphore is not None:
+                async with semaphore:
+                    code = await NEventLoop._spawn(args, kwargs)
+            else:
+                code = await NEventLoop._spawn(args, kwargs)
+        except Exception:
+            # Nobody may be waiting on the future: report the failure, and still call back so that the caller moves on.
+            if LOG.bError:
+                LOG.error("Could not run %s:\n%s", args, traceback.format_exc())
+            code = SPAWN_FAILED
+
+        if callback is not None:
+            try:
+                callback(code)
+            except Exception:
+                if LOG.bError:
+                    LOG.error("Process callback failed:\n%s", traceback.format_exc())
+
+        return code
+
+    @staticmethod
+    async def _spawn(args, kwargs):
+        kwargs.setdefault('stdin', subprocess.DEVNULL)
+        proc = await asyncio.create_subprocess_exec(*args, **kwargs)
+        return await proc.wait()
+
+    def stop(self):
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+                self._loop.close()
+                self._loop = None
+                self._thread = None
+                self._semaphore = None
+
+
+def getEventLoop():
+    """
+    Get the event loop shared by the application. Its thread is started on first use.
+    """
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = NEventLoop()
+
+        return _LOOP
@@ -0,0 +1,121 @@
+import concurrent.futures, multiprocessing, pickle, threading, traceback
+from Nodes.CoreLog import LOG
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+class NValueProxy(object):
+    """
+    Picklable stand-in for a NDynamicAttr, used by scripts running in another process.
+    It exposes the same get() / set() interface, and remembers whether the script wrote to it.
+    """
+    def __init__(self, value=None):
+        self._value = value
+        self.bWritten = False
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+        self.bWritten = True
+
+
+class NProcessPool(object):
+    """
+    Pool of worker processes used to run CPU-bound scripts and exposed methods outside of the GIL.
+    Functions and values sent to the pool must be picklable: module-level functions and plain or N* values.
+    """
+    def __init__(self, maxWorkers=0):
+        self._maxWorkers = maxWorkers if maxWorkers > 0 else multiprocessing.cpu_count()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def maxWorkers(self):
+        return self._maxWorkers
+
+    def submit(self, func, *args, callback=None):
+        """
+        Run a function in a worker process.
+        :param func: A picklable function.
+        :param args: Picklable arguments.
+        :param callback: Optional function receiving the result once done. It is called from a pool thread, and not called if the function failed.
+        :return: The concurrent.futures.Future of the call. Its exception() is the error raised by a failed call.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self._maxWorkers)
+
+            future = self._executor.submit(func, *args)
+
+        if callback is not None:
+            future.add_done_callback(lambda f: NProcessPool._runCallback(callback, f))
+
+        return future
+
+    @staticmethod
+    def _runCallback(callback, future):
+        if future.cancelled():
+            return
+
+        e = future.exception()
+        if e is not None:
+            if LOG.bError:
+                LOG.error("Process pool task failed:\n%s", ''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+            return
+
+        try:
+            callback(future.result())
+        except Exception:
+            if LOG.bError:
+                LOG.error("Process pool callback failed:\n%s", traceback.format_exc())
+
+    def shutdown(self, bWait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=bWait)
+                self._executor = None
+
+
+def getProcessPool(maxWorkers=0):
+    """
+    Get the process pool shared by the application. It is created on first use.
+    :param maxWorkers: Number of worker processes, only used when the pool is created. Defaults to the cpu count.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = NProcessPool(maxWorkers)
+
+        return _POOL
+
+
+def isPicklable(value):
+    try:
+        pickle.dumps(value)
+    except Exception:
+        return False
+
+    return True
+
+
+def runScript(code: str, values: dict):
+    """
+    Entry point of scripts executed in a worker process.
+    :param code: The script source.
+    :param values: Name -> value of the attributes the script reads, other picklable locals are passed as is.
+    :return: Name -> value of the attributes the script wrote to.
+    """
+    local_vars = {}
+    proxies = {}
+    for k, (bIsAttr, v) in values.items():
+        if bIsAttr:
+            proxies[k] = local_vars[k] = NValueProxy(v)
+        else:
+            local_vars[k] = v
+
+    exec(code, {}, local_vars)
+
+    return {k: p.get() for k, p in proxies.items() if p.bWritten}
@@ -1,10 +1,20 @@
 from Delegates import InternalDelegates as NDel
 from Nodes.Core import NObject, NScript
-import threading
+from Nodes.CoreLog import LOG
+import threading, queue, concurrent.futures, multiprocessing, traceback, time
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
 
 
 class NThread(threading.Thread, NObject):
-    def __init__(self, threadName, owner=None, bDestroyAfterWork=False):
+    """
+    Thread running either a single NScript, or the tasks bound with addTask.
+    Tasks are ticked when the thread is woken up, by addTask or wake(). With a tick rate above 0 they are ticked at that frequency
+    instead, as long as there is at least one task. The thread sleeps while there is nothing to do.
+    """
+    def __init__(self, threadName, owner=None, bDestroyAfterWork=False, tickRate=0.0):
         threading.Thread.__init__(self)
         NObject.__init__(self, name=threadName, owner=owner)
         self.__dispatchedTicks = NDel.Delegate("%s_Delegate" % threadName, self)
@@ -14,10 +24,15 @@ class NThread(threading.Thread, NObject):
         self.aliveStatus = True
         self.threadSpawnedFrom = threading.get_ident()
         self.bShouldDestroyOnceDone = bDestroyAfterWork
+        self._tickCondition = threading.Condition()
+        self._bTickRequested = False
+        self._tickRate = max(float(tickRate), 0.0)
+        self._nextTick = 0.0
 
     def run(self):
         assert threading.get_ident() != self.threadSpawnedFrom, "ASSERTION ERROR: Thread was not started properly. currentThread != thisThread"
-        print("Starting thread. ID: %s" % threading.get_ident())
+        if LOG.bDebug:
+            LOG.debug("Starting thread. ID: %s", threading.get_ident())
         r = 0
         if self.script_to_run:
             r = self.script_to_run.exec(bFromThread=True)
@@ -26,13 +41,66 @@ class NThread(threading.Thread, NObject):
                 self.kill()
 
         else:
-            while self.aliveStatus:
+            while self._waitForTick():
                 self.__dispatchedTicks.execute()
 
         self.__workDone.execute(r)
 
+    def _waitForTick(self):
+        """
+        Block until the next tick is due, or the thread is killed.
+        :return: False if the thread was killed while waiting.
+        """
+        with self._tickCondition:
+            # The tick rate is read again after every wait, so that setTickRate() applies to a thread that is already waiting.
+            while self.aliveStatus:
+                if self._tickRate > 0:
+                    now = time.monotonic()
+                    if len(self.__dispatchedTicks._functions) == 0:
+                        self._tickCondition.wait()
+                    elif now < self._nextTick:
+                        self._tickCondition.wait(self._nextTick - now)
+                    else:
+                        period = 1.0 / self._tickRate
+                        self._nextTick += period
+                        if self._nextTick <= now:
+                            # Late ticks are not caught up on, the next one is scheduled a full period from now.
+                            self._nextTick = now + period
+                        self._bTickRequested = False
+                        return True
+
+                elif self._bTickRequested:
+                    self._bTickRequested = False
+                    return True
+
+                else:
+                    self._tickCondition.wait()
+
+            return False
+
+    def wake(self):
+        """
+        Request a tick of the bound tasks. Requests made before the thread gets to them are merged into a single tick.
+        """
+        with self._tickCondition:
+            self._bTickRequested = True
+            self._tickCondition.notify()
+
+    def setTickRate(self, v: float):
+        """
+        Set how many times per second tasks are ticked. 0 means they are only ticked when the thread is woken up.
+        """
+        with self._tickCondition:
+            self._tickRate = max(float(v), 0.0)
+            self._nextTick = 0.0
+            self._tickCondition.notify()
+
+    def getTickRate(self):
+        return self._tickRate
+
     def addTask(self, objRef, funcName=""):
         self.__dispatchedTicks.bindFunction(objRef, funcName)
+        self.wake()
 
     def asyncTask(self, code: NScript):
         self.script_to_run = code
@@ -41,10 +109,162 @@ class NThread(threading.Thread, NObject):
         self.__dispatchedTicks.removeFunction(objRef, funcName)
 
     def kill(self):
-        self.aliveStatus = False
+        with self._tickCondition:
+            self.aliveStatus = False
+            self._tickCondition.notify_all()
 
     def bindFinishedEvent(self, obj: object, func: str):
         self.__workDone.bindFunction(obj, func)
 
     def removeFinishedEvent(self, obj: object, func: str):
-        self.__workDone.removeFunction(obj, func)
\ No newline at end of file
+        self.__workDone.removeFunction(obj, func)
+
+
+class NPoolWorker(NThread):
+    """
+    Thread of a NThreadPool. It lives as long as the pool and runs the tasks pulled from the pool's queue.
+    Pulling None from the queue makes it leave the pool.
+    """
+    def __init__(self, threadName, pool):
+        super(NPoolWorker, self).__init__(threadName, owner=pool)
+        self.daemon = True
+        self._pool = pool
+        self._queue = pool._queue
+
+    def run(self):
+        while self.aliveStatus:
+            task = self._queue.get()
+            if task is None:
+                break
+
+            future, func, args, kwargs = task
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        self.aliveStatus = False
+        self._pool._OnWorkerExit(self)
+
+
+class NThreadPool(NObject):
+    """
+    Fixed set of persistent worker threads fed from a single work queue.
+    Submitting a task costs a queue put, no thread or NObject is created or destroyed per task.
+    With a queue depth above 0, submit() blocks once that many tasks are waiting.
+    """
+    def __init__(self, name, size=0, queueDepth=0, owner=None):
+        super(NThreadPool, self).__init__(name=name, owner=owner)
+        self._size = size if size > 0 else multiprocessing.cpu_count()
+        self._queue = queue.Queue(maxsize=max(queueDepth, 0))
+        self._workers = []
+        self._retiring = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def getSize(self):
+        return self._size
+
+    def getQueueDepth(self):
+        return self._queue.maxsize
+
+    def pendingTasks(self):
+        return self._queue.qsize()
+
+    def _ensureWorkers(self):
+        with self._lock:
+            while len(self._workers) - self._retiring < self._size:
+                worker = NPoolWorker("%s_Worker_%d" % (self.getName(), self._count), self)
+                self._count += 1
+                self._workers.append(worker)
+                worker.start()
+
+    def _OnWorkerExit(self, worker):
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+                self._retiring = max(self._retiring - 1, 0)
+
+    def submit(self, func, *args, callback=None, **kwargs):
+        """
+        Run a function on one of the pool's threads. Workers are started on first use.
+        :param func: The function to call.
+        :param callback: Optional function receiving the result once done. It is called from the worker thread.
+        :return: The concurrent.futures.Future of the call.
+        """
+        self._ensureWorkers()
+        future = concurrent.futures.Future()
+        if callback is not None:
+            future.add_done_callback(lambda f: NThreadPool._runCallback(callback, f))
+
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    @staticmethod
+    def _runCallback(callback, future):
+        if future.cancelled():
+            return
+
+        e = future.exception()
+        if e is not None:
+            if LOG.bError:
+                LOG.error("Thread pool task failed:\n%s", ''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+            return
+
+        try:
+            callback(future.result())
+        except Exception:
+            if LOG.bError:
+                LOG.error("Thread pool callback failed:\n%s", traceback.format_exc())
+
+    def resize(self, size: int, queueDepth: int = None):
+        """
+        Change the number of workers and optionally the queue depth. Tasks already queued are kept.
+        Extra workers leave the pool once they are done with their current task.
+        :param size: The new number of workers. 0 means the cpu count.
+        :param queueDepth: How many tasks may wait in the queue before submit() blocks. 0 means no limit.
+        """
+        size = size if size > 0 else multiprocessing.cpu_count()
+        if queueDepth is not None:
+            with self._queue.mutex:
+                self._queue.maxsize = max(queueDepth, 0)
+                self._queue.not_full.notify_all()
+
+        with self._lock:
+            self._size = size
+            extra = len(self._workers) - self._retiring - size
+            self._retiring += max(extra, 0)
+
+        for _ in range(extra):
+            self._queue.put(None)
+
+    def shutdown(self, bWait=True):
+        """
+        Stop all workers once the tasks queued so far are done. The pool starts new workers if used again.
+        """
+        with self._lock:
+            workers = list(self._workers)
+            count = len(workers) - self._retiring
+            self._retiring += count
+
+        for _ in range(count):
+            self._queue.put(None)
+
+        if bWait:
+            for worker in workers:
+                worker.join()
+
+
+def getThreadPool():
+    """
+    Get the thread pool shared by the application, used by async scripts. Its workers are started on first use.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = NThreadPool('THREAD_POOL')
+
+        return _POOL
@@ -0,0 +1,13 @@
+# Dependencies for Visual Scripting
+from Nodes import FuncNodes
+from MayaLib import MayaNodes
+from NukeLib import NukeNodes
+from RenderingLib import UtilsNodes
+
+
+"""
+# =============================================================================================
+                Define all modules to be used in the nodal system here.
+# =============================================================================================
+"""
+DEPENDENCY_LIST = [FuncNodes, MayaNodes, NukeNodes, UtilsNodes]
@@ -1,10 +1,13 @@
 
-import multiprocessing, sys, os
+import multiprocessing, sys, os, threading, concurrent.futures
 from Nodes.Decorators import *
 from Delegates.InternalDelegates import *
 from Nodes.CoreProperties import *
 from Nodes.CoreObject import *
 from Nodes.WeakReferences import *
+from Nodes.CoreUtils import UCoreUtils
+from NThreads import NAsync
+import global_accessor as GA
 import types
 
 
@@ -21,6 +24,8 @@ class NWorld(NObject):
         self._WindowReference = None
         self._graphReference = None
         self._registered_objects = {}
+        # Set when independent branches should run concurrently. See setParallel().
+        self._scheduler = None
 
     def getInterfaceRef(self):
         """
@@ -55,6 +60,110 @@ class NWorld(NObject):
         else:
             raise TypeError("%s is not of type NObject." % obj.__class__.__name__)
 
+    @staticmethod
+    def registerLibraries(libraries):
+        """
+        Register the node classes and exposed functions of the given modules, so they can be spawned by name.
+        :param libraries: An iterable of modules.
+        """
+        all_ = {}
+        for lib in libraries:
+            all_.update(lib.__dict__)
+
+        for k, cls in all_.items():
+            if UCoreUtils.checkBases(cls, NFunctionBase):
+                if not getattr(cls, 'NO_DISPLAY', False):
+                    GA.registerFunction(cls)
+
+            elif callable(cls) and isinstance(cls, types.FunctionType):
+                if getattr(cls, '__VisibleFunc__', False):
+                    GA.registerFunction(cls)
+
+    @staticmethod
+    def connectNodes(plugNode, plugAttr: str, socketNode, socketAttr: str):
+        """
+        Perform the logical connection between two node attributes, the same way the Ui does.
+        An execution output (a property registered with REGISTER_HOOK) is bound to the target function,
+        a NDynamicAttr is connected to the target attribute.
+        :param plugNode: The node holding the output.
+        :param plugAttr: The output property name.
+        :param socketNode: The node holding the input.
+        :param socketAttr: The input property name.
+        :return: The list of created BoundMethods.
+        """
+        prop = getattr(plugNode, plugAttr)
+        if isinstance(prop, NDynamicAttr):
+            return prop.connect(socketNode, socketAttr)
+
+        elif callable(prop):
+            delegate = plugNode.__PropHooks__.get(plugAttr, None)
+            if delegate is None:
+                raise RuntimeError("Delegate for %s.%s not registered." % (plugNode.getName(), plugAttr))
+
+            return [delegate.bindFunction(socketNode, socketAttr)]
+
+        raise TypeError("%s.%s is not connectible." % (plugNode.getName(), plugAttr))
+
+    def compile(self, entryNode):
+        """
+        Compile the graph reachable from a node into an execution plan, which caches the dispatch of its delegates.
+        The plan is rebuilt automatically when it runs if a connection changed in the meantime.
+        :param entryNode: The node to start the execution from.
+        :type entryNode: NFunctionBase.
+        :return: The compiled NExecutionPlan.
+        """
+        if not isinstance(entryNode, NFunctionBase):
+            raise TypeError("%s is not of type NFunctionBase." % entryNode.__class__.__name__)
+
+        plan = NExecutionPlan(entryNode, self._scheduler)
+        plan.build()
+        return plan
+
+    def setParallel(self, v: bool, maxWorkers: int = 0):
+        """
+        Toggle the parallel scheduler. When enabled, plans compiled by this world run the branches of an execution output
+        that share no node concurrently, and wait for all of them before the output returns.
+        :param v: Whether to enable the parallel scheduler.
+        :param maxWorkers: Size of the worker pool. Defaults to CPU_COUNT.
+        """
+        if self._scheduler is not None:
+            self._scheduler.shutdown()
+            self._scheduler = None
+
+        if v:
+            self._scheduler = NBranchScheduler(maxWorkers if maxWorkers > 0 else self.CPU_COUNT)
+
+    def isParallel(self):
+        return self._scheduler is not None
+
+    def setMaxProcessJobs(self, v: int):
+        """
+        Set how many external processes launched by async batch scripts may run at once. 0 means no limit.
+        """
+        NAsync.getEventLoop().setMaxJobs(v)
+
+    def getMaxProcessJobs(self):
+        return NAsync.getEventLoop().getMaxJobs()
+
+    @staticmethod
+    def getThreadPool():
+        from NThreads import NThreading
+        return NThreading.getThreadPool()
+
+    def setThreadPoolSize(self, size: int, queueDepth: int = None):
+        """
+        Set the number of worker threads running async scripts, and optionally how many tasks may wait for one.
+        :param size: The number of workers. 0 means the cpu count.
+        :param queueDepth: Number of queued tasks after which submitting blocks. 0 means no limit, None keeps the current one.
+        """
+        self.getThreadPool().resize(size, queueDepth)
+
+    def getThreadPoolSize(self):
+        return self.getThreadPool().getSize()
+
+    def getThreadQueueDepth(self):
+        return self.getThreadPool().getQueueDepth()
+
 
 class NDynamicAttr(NObject):
     """
@@ -78,30 +187,83 @@ class NDynamicAttr(NObject):
         if not kwargs.get('noInput', False):
             self._sktDelegate = CollectorSingle("%s_ValueQueryListener" % self.getName(), self)
 
+        # A clean attribute holds an up to date value, and reads return it without re-evaluating its provider.
+        # Attributes are invalidated when something they depend on changes.
+        self._bDirty = True
+
         self._onEvaluated = None
         ehook = kwargs.get("EvaluationHook", None)
         if ehook:
             self._onEvaluated = NWeakMethod(ehook)
+            if isinstance(Owner, NFunctionBase):
+                Owner.registerEvaluatedAttr(self)
 
     def set(self, value, bMute=False, bFromCaller=False):
-        if not bFromCaller and self._onEvaluated and self._onEvaluated.isValid():
-            self._onEvaluated()()
-
         self._value = self.check(value)
+
+        # A value pushed into an input stays dirty if its provider is, so the next read pulls the final value.
+        upstream = self.getUpstream()
+        self._bDirty = upstream is not None and upstream.isDirty()
+
+        if not bFromCaller and isinstance(self._owner, NFunctionBase):
+            # Values computed by the owner's evaluation hooks depend on this one.
+            self._owner.invalidate(self)
+
         if not bMute:
             self._valueChanged.execute(value)
+        else:
+            self._invalidateDownstream()
 
     def get(self, bUpdate=True, bFromCaller=False):
-        if not bFromCaller and self._onEvaluated and self._onEvaluated.isValid() and bUpdate:
-            self._onEvaluated()()
+        if bUpdate and self._bDirty:
+            bHasHook = self._onEvaluated is not None and self._onEvaluated.isValid()
+            if bHasHook and not bFromCaller:
+                self._onEvaluated()()
+
+            if self._sktDelegate and self._sktDelegate.isBound():
+                self._value = self.check(self._sktDelegate.call(bUpdate=True))
 
-        if bUpdate and self._sktDelegate and self._sktDelegate.isBound():
-            self._value = self.check(self._sktDelegate.call(bUpdate=True))
+            if not bHasHook or not bFromCaller:
+                self._bDirty = False
 
         return self._value
 
+    def isDirty(self):
+        return self._bDirty
+
+    def invalidate(self):
+        """
+        Mark the cached value as stale, along with every attribute depending on it.
+        Propagation stops at attributes that are already dirty, so each attribute is visited at most once.
+        """
+        if self._bDirty:
+            return
+
+        self._bDirty = True
+        self._invalidateDownstream()
+
+        if isinstance(self._owner, NFunctionBase):
+            self._owner.invalidate(self)
+
+    def _invalidateDownstream(self):
+        for func in self._valueChanged._functions:
+            obj = func.getLinkedObject()
+            if isinstance(obj, NDynamicAttr):
+                obj.invalidate()
+
+    def getUpstream(self):
+        """
+        Get the attribute this one reads its value from.
+        :return: The connected NDynamicAttr, None if this attribute is not connected.
+        """
+        if self._sktDelegate and self._sktDelegate.isBound():
+            obj = self._sktDelegate._functions[0].getLinkedObject()
+            return obj if isinstance(obj, NDynamicAttr) else None
+
+        return None
+
     def evaluate(self):
-        self._valueChanged.execute(self._value)
+        self._valueChanged.execute(self.get())
 
     def hasConnection(self):
         return self._sktDelegate.isBound() if self._sktDelegate else False
@@ -146,6 +308,10 @@ class NDynamicAttr(NObject):
         if self._dataType == EDataType.DT_Variant:
             return o
 
+        if self._dataType == EDataType.DT_Iterable and isinstance(o, NStream):
+            # Keep streams lazy, casting them to list would produce every item.
+            return o
+
         if not isinstance(o, DATACLASSES[self._dataType]):
             obj = DATACLASSES[self._dataType](o)
             return obj
@@ -157,9 +323,15 @@ class NFunctionBase(NObject):
     def __init__(self, funcName, Owner=None, FuncType=EFuncType.FT_Callable):
         super(NFunctionBase, self).__init__(name=funcName, owner=Owner)
 
+        # Cached result of getExposedProps(). Dropped by NATTR / RNATTR, and when an exposed attribute is set or deleted.
+        self.__PropOrder__ = None
+
         # Holds a list of generated attributes. Can be used if the function is modified at runtime.
         self._generatedAttributes = []
 
+        # Attributes whose value is computed by an evaluation hook, by name. They are invalidated whenever another attribute changes.
+        self._evaluatedAttrs = {}
+
         # Can be called if the function is being dynamically modified at runtime.
         self.onClassChanged = DelegateMulticast("onClassChangedDelegate_%s" % self.getName(), self)
         self.onAttributeChanged = DelegateMulticast('onAttributeAddedDelegate_%s' % self.getName(), self)
@@ -187,6 +359,18 @@ class NFunctionBase(NObject):
     def type_(self):
         return self._funcType
 
+    def registerEvaluatedAttr(self, attr):
+        self._evaluatedAttrs[attr.getName().toString()] = attr
+
+    def invalidate(self, source=None):
+        """
+        Mark every attribute computed by an evaluation hook as stale. Called when one of the node's attributes changes.
+        :param source: The attribute that changed. It is not invalidated.
+        """
+        for attr in self._evaluatedAttrs.values():
+            if attr is not source:
+                attr.invalidate()
+
     def classInfo(self):
         """
         Can be used to get the class name. It can be overriden if specific data is expected.
@@ -200,46 +384,62 @@ class NFunctionBase(NObject):
         :param getter_syntax: The syntax to use to parse the getter name. Its default value is '_get_{n}' with n being the original setter's name.
         :type getter_syntax: str
         """
-        properties = []
-        for x in dir(self):
-            ref = getattr(self, x)
-            if callable(ref) and isinstance(ref, types.MethodType):
-                properties.append(ref)
+        for setter, getter in CLASS_META(self).getterPairs(getter_syntax):
+            REGISTER_GETTER(self, setter, getattr(self, getter))
+
+    @staticmethod
+    def _isExposed(val):
+        return isinstance(val, NDynamicAttr) or (callable(val) and getattr(val, EXPOSEDPROPNAME, None) and getattr(val, EXPOSED_EXTRADATA, None))
+
+    def __setattr__(self, name, value):
+        if NFunctionBase._isExposed(value) or NFunctionBase._isExposed(self.__dict__.get(name, None)):
+            self.__dict__['__PropOrder__'] = None
+
+        super(NFunctionBase, self).__setattr__(name, value)
+
+    def __delattr__(self, name):
+        if NFunctionBase._isExposed(self.__dict__.get(name, None)):
+            self.__dict__['__PropOrder__'] = None
 
-        for prop in properties:
-            getter_name = getter_syntax.format(n=prop.__name__)
-            for p in properties:
-                if p != prop:
-                    if p.__name__.lower() == getter_name.lower():
-                        REGISTER_GETTER(self, prop.__name__, p)
+        super(NFunctionBase, self).__delattr__(name)
 
     def getExposedProps(self):
+        """
+        Get the names of the @Property methods and NDynamicAttrs of this node, in display order.
+        The result is cached until NATTR / RNATTR is used on this node, or an exposed attribute is set or deleted.
+        """
+        cache = self.__PropOrder__
+        if cache is not None:
+            return list(cache)
+
+        members = vars(self)
+        candidates = [x for x in CLASS_META(self).exposed if x not in members]
+        for attr, val in members.items():
+            if NFunctionBase._isExposed(val):
+                candidates.append(attr)
+
+        # Same order as dir(), which the position conflicts below depend on.
+        candidates.sort()
 
         mapping = {}
-        for attr in dir(self):
+        for attr in candidates:
             val = getattr(self, attr)
-            if callable(val):
-                propInfo = getattr(val, EXPOSEDPROPNAME, None)
-                propDetails = getattr(val, EXPOSED_EXTRADATA, None)
-                if propInfo and propDetails:
-                    p = propDetails['pos']
-                    keys = mapping.keys()
-                    if p in keys:
-                        p = max(keys) + 1
-                    mapping[p] = attr
-
-            elif isinstance(val, NDynamicAttr):
-                info = self.__PropFlags__.get(attr, (None, None, -1))
-                p = info[2]
-                keys = mapping.keys()
-                if p in mapping.keys():
-                    p = max(keys) + 1
-                mapping[p] = attr
+            if isinstance(val, NDynamicAttr):
+                p = self.__PropFlags__.get(attr, (None, None, -1))[2]
+            else:
+                p = getattr(val, EXPOSED_EXTRADATA)['pos']
+
+            keys = mapping.keys()
+            if p in keys:
+                p = max(keys) + 1
+            mapping[p] = attr
 
         keys = list(mapping.keys())
         keys.sort()
 
-        return [mapping[idx] for idx in keys]
+        order = [mapping[idx] for idx in keys]
+        self.__PropOrder__ = order
+        return list(order)
 
     def evaluate(self):
         for item in self.getExposedProps():
@@ -259,3 +459,254 @@ class NFunctionBase(NObject):
         in which case this function should be overridden to regenerate the attributes.
         """
         pass
+
+
+class NExecutionPlan(object):
+    """
+    Dispatch cache for the nodes reachable from an entry node.
+    Building the plan walks the execution and data connections once, and resolves every BoundMethod of the visited delegates
+    into hard method references. Running the plan installs these on the delegates, so that firing them calls the targets directly
+    instead of going through the BoundMethod / weak reference dispatch.
+    Nodes still drive the execution themselves: control flow, such as loops and branches, lives in their execute() methods.
+    """
+    def __init__(self, entryNode, scheduler=None):
+        self._entry = NWeakRef(entryNode)
+        self._scheduler = scheduler
+        # Nodes in discovery order.
+        self._nodes = []
+        # List of (delegate, callables) in node order.
+        self._instructions = []
+        self._revisions = []
+        # Node id -> nodes that run after it (execution wires and data consumers).
+        self._successors = {}
+        # Node id -> nodes it reads data from.
+        self._providers = {}
+
+    @staticmethod
+    def _attributes(node):
+        return [v for v in vars(node).values() if isinstance(v, NDynamicAttr)]
+
+    @staticmethod
+    def _delegates(node):
+        """
+        Get the delegates of a node that take part in execution: its execution outputs, then the data delegates of its attributes.
+        """
+        delegates = list(node.__PropHooks__.values())
+        for attr in NExecutionPlan._attributes(node):
+            delegates.append(attr.getOutDelegate())
+            if attr.getInDelegate():
+                delegates.append(attr.getInDelegate())
+
+        return delegates
+
+    @staticmethod
+    def _linkedNode(obj):
+        if isinstance(obj, NDynamicAttr):
+            obj = obj._owner
+
+        return obj if isinstance(obj, NFunctionBase) else None
+
+    def build(self):
+        """
+        Walk the graph from the entry node and regenerate the instruction list.
+        """
+        entry = self._entry()
+        if entry is None:
+            raise RuntimeError("Entry node of %s no longer exists." % self.__class__.__name__)
+
+        # Discover every node reachable through execution wires or data connections, and record the edges.
+        order = [entry]
+        visited = {id(entry)}
+        edges = {}
+        providers = {}
+        i = 0
+        while i < len(order):
+            node = order[i]
+            i += 1
+            successors = edges.setdefault(id(node), [])
+            linked = []
+            for delegate in node.__PropHooks__.values():
+                linked.extend((bm.getLinkedObject(), 'exec') for bm in delegate._functions)
+
+            for attr in NExecutionPlan._attributes(node):
+                linked.extend((bm.getLinkedObject(), 'out') for bm in attr.getOutDelegate()._functions)
+                if attr.getInDelegate():
+                    # Upstream providers must run before this node.
+                    linked.extend((bm.getLinkedObject(), 'in') for bm in attr.getInDelegate()._functions)
+
+            for obj, kind in linked:
+                other = NExecutionPlan._linkedNode(obj)
+                if other is None or other is node:
+                    continue
+
+                if kind == 'in':
+                    edges.setdefault(id(other), []).append(node)
+                    providers.setdefault(id(node), []).append(other)
+                else:
+                    successors.append(other)
+                    if kind == 'out':
+                        providers.setdefault(id(other), []).append(node)
+
+                if id(other) not in visited:
+                    visited.add(id(other))
+                    order.append(other)
+
+        # The edges tell which branches may run concurrently, see _branchGroups().
+        self._successors = edges
+        self._providers = providers
+        self._nodes = order
+
+        self._instructions = []
+        for node in self._nodes:
+            execDelegates = list(node.__PropHooks__.values())
+            for delegate in NExecutionPlan._delegates(node):
+                calls = delegate.compile()
+                if self._scheduler is not None and len(calls) > 1 and any(delegate is d for d in execDelegates):
+                    groups = self._branchGroups(node, delegate)
+                    if len(groups) > 1:
+                        calls = (self._scheduler.dispatcher(groups),)
+
+                self._instructions.append((delegate, calls))
+
+        self._revisions = [d.revision() for d, _ in self._instructions]
+
+    def _footprint(self, source, node):
+        """
+        Get the ids of every node a branch may touch: the nodes running after it, and the nodes they read data from.
+        The node firing the branch is excluded, its outputs are not written while its branches run.
+        """
+        result = set()
+        pending = [node]
+        while pending:
+            n = pending.pop()
+            if n is source or id(n) in result:
+                continue
+
+            result.add(id(n))
+            pending.extend(self._successors.get(id(n), []))
+            pending.extend(self._providers.get(id(n), []))
+
+        return result
+
+    def _branchGroups(self, source, delegate):
+        """
+        Split the functions bound to an execution delegate into groups that share no node.
+        Groups can run concurrently, functions within a group keep their binding order.
+        :return: A list of lists of callables.
+        """
+        groups = []
+        for bm in delegate._functions:
+            call = bm.getFuncRef()
+            if call is None:
+                continue
+
+            target = NExecutionPlan._linkedNode(bm.getLinkedObject())
+            footprint = self._footprint(source, target) if target is not None else None
+
+            # Merge every group this branch overlaps with. Unknown targets are serialized with everything.
+            merged = [[call], footprint]
+            kept = []
+            for group in groups:
+                if footprint is None or group[1] is None or footprint & group[1]:
+                    merged[0] = group[0] + merged[0]
+                    merged[1] = None if (merged[1] is None or group[1] is None) else merged[1] | group[1]
+                else:
+                    kept.append(group)
+
+            kept.append(merged)
+            groups = kept
+
+        return [g[0] for g in groups]
+
+    def isValid(self):
+        """
+        A plan is valid as long as its entry node is alive and none of the compiled delegates had its bindings changed.
+        """
+        if not self._entry.isValid():
+            return False
+
+        for (delegate, _), rev in zip(self._instructions, self._revisions):
+            if delegate.revision() != rev:
+                return False
+
+        return True
+
+    def nodes(self):
+        return list(self._nodes)
+
+    def run(self):
+        """
+        Execute the plan from its entry node, rebuilding it first if the graph changed since it was compiled.
+        """
+        if not self.isValid():
+            self.build()
+
+        for delegate, calls in self._instructions:
+            delegate.setCompiled(calls)
+
+        try:
+            self._entry().execute()
+        finally:
+            for delegate, _ in self._instructions:
+                delegate.setCompiled(None)
+
+
+class NBranchScheduler(object):
+    """
+    Runs groups of independent branches on a bounded pool of worker threads.
+    Branches fired from a worker run inline, so that nested parallel outputs never wait on the pool they occupy.
+    Groups share no node, so the attributes of a node, and their dirty flags, are only written by the branch running it.
+    Branches may create and destroy objects: the object registry is locked, see global_accessor.NRegistry.
+    """
+    def __init__(self, maxWorkers):
+        self._maxWorkers = maxWorkers
+        self._pool = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def dispatcher(self, groups):
+        """
+        Create a callable that runs the groups of branches concurrently when called.
+        :param groups: A list of lists of callables, as returned by NExecutionPlan._branchGroups().
+        """
+        def dispatch(*args, **kwargs):
+            self.run(groups, *args, **kwargs)
+
+        return dispatch
+
+    def run(self, groups, *args, **kwargs):
+        if len(groups) < 2 or getattr(self._local, 'bWorker', False):
+            for group in groups:
+                NBranchScheduler._runGroup(group, args, kwargs)
+            return
+
+        pool = self._getPool()
+        futures = [pool.submit(self._runWorker, group, args, kwargs) for group in groups[1:]]
+        try:
+            NBranchScheduler._runGroup(groups[0], args, kwargs)
+        finally:
+            # Join every branch before returning, so nodes fired after this output see their results.
+            for f in futures:
+                f.result()
+
+    def _runWorker(self, group, args, kwargs):
+        self._local.bWorker = True
+        NBranchScheduler._runGroup(group, args, kwargs)
+
+    @staticmethod
+    def _runGroup(group, args, kwargs):
+        for call in group:
+            call(*args, **kwargs)
+
+    def _getPool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._maxWorkers, thread_name_prefix='NBranchScheduler')
+
+            return self._pool
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
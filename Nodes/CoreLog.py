@@ -0,0 +1,93 @@
+"""
+Logging for NodeProcess. Messages go through the standard logging module, under the 'NodeProcess' logger.
+Check the flag of a level before building its message, so that a disabled level only costs an attribute lookup:
+
+    if LOG.bDebug:
+        LOG.debug("registering new object: %s", obj)
+
+The level is read from the "LOGGING" section of NodeProcess.config, and defaults to warnings only.
+"""
+import logging, json, os, sys
+
+
+class ELogLevel:
+    LL_Debug = logging.DEBUG
+    LL_Info = logging.INFO
+    LL_Warning = logging.WARNING
+    LL_Error = logging.ERROR
+
+
+class NLog(object):
+    __slots__ = ('_logger', 'bDebug', 'bInfo', 'bWarning', 'bError')
+
+    def __init__(self, name: str = 'NodeProcess', level=ELogLevel.LL_Warning):
+        self._logger = logging.getLogger(name)
+        if not self._logger.handlers:
+            handler = logging.StreamHandler(sys.stdout)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._logger.addHandler(handler)
+            self._logger.propagate = False
+
+        self.setLevel(level)
+
+    def setLevel(self, level):
+        """
+        :param level: An ELogLevel value, or a level name such as "debug".
+        """
+        if isinstance(level, str):
+            value = logging.getLevelName(level.upper())
+            if not isinstance(value, int):
+                raise ValueError("Unknown log level %s." % level)
+            level = value
+
+        self._logger.setLevel(level)
+        self.bDebug = level <= ELogLevel.LL_Debug
+        self.bInfo = level <= ELogLevel.LL_Info
+        self.bWarning = level <= ELogLevel.LL_Warning
+        self.bError = level <= ELogLevel.LL_Error
+
+    def getLevel(self):
+        return self._logger.level
+
+    def configure(self, config: dict):
+        """
+        Apply the "LOGGING" section of a configuration: {"Level": "info", "File": "path/to/file.log"}.
+        """
+        section = config.get('LOGGING', {})
+        if section.get('File', None):
+            handler = logging.FileHandler(section['File'])
+            handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(message)s'))
+            self._logger.addHandler(handler)
+
+        level = section.get('Level', ELogLevel.LL_Warning)
+        try:
+            self.setLevel(level)
+        except (ValueError, TypeError):
+            # Configuration is applied on import: a typo must not keep every module from loading.
+            self.setLevel(ELogLevel.LL_Warning)
+            self.warning("Unknown log level %r in the LOGGING configuration, falling back to warning.", level)
+
+    def debug(self, msg: str, *args):
+        self._logger.debug(msg, *args)
+
+    def info(self, msg: str, *args):
+        self._logger.info(msg, *args)
+
+    def warning(self, msg: str, *args):
+        self._logger.warning(msg, *args)
+
+    def error(self, msg: str, *args):
+        self._logger.error(msg, *args)
+
+
+def _loadConfig():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'NodeProcess.config')
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+LOG = NLog()
+LOG.configure(_loadConfig())
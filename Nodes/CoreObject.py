@@ -1,7 +1,8 @@
-import uuid, json, warnings
+import json, warnings
 from Nodes.Decorators import *
 from Nodes.CoreProperties import *
 import global_accessor as GA
+from Nodes.CoreLog import LOG
 
 
 
@@ -9,7 +10,7 @@ class NObject(object):
     """
         This is the root object for all node-based logic in this software. It holds a few functions that serve as the base
         for every other NObject subclass. It is made of overridable functions that are expected to be used everywhere in many different instances.
-        Every NObject has a 64-bit UUID that is used to have every object be "unique".
+        Every NObject has a 128-bit UUID (NUUID) that is used to have every object be "unique".
     """
     def __init__(self, **kwargs):
 
@@ -18,30 +19,47 @@ class NObject(object):
         inOwner = kwargs.get('owner', None); world = kwargs.get('world', None); assert world.__class__.__name__ == 'NWorld' if world else True
 
         NATTR(self, '_uuid', EAttrType.AT_Serializable)
-        self._uuid = NString(uuid.uuid4())
+        self._uuid = NUUID()
 
         NATTR(self, '_name', EAttrType.AT_Serializable)
         self._name = NString(kwargs.get('name', "Unnamed"))
 
         self._owner = NWeakRef(inOwner) if kwargs.get("UseHardRef", False) and inOwner else inOwner
 
+        # Objects created with this one as owner, and connections targeting this one, by id. Both are walked by destroy().
+        self._owned = None
+        self._connections = None
+        if isinstance(inOwner, NObject):
+            inOwner._adopt(self)
+
         #  Always keep a hard reference of NWorld.
         self._world = world
 
         if self.getWorld():
             self._world.registerObjectWithWorld(self)
 
-        if not kwargs.get('noClassRegister', False):
-            CLASS_REGISTER(self)
+        # Registry handle, 0 for objects that are not registered. See global_accessor.NRegistry.
+        self._registryHandle = CLASS_REGISTER(self) if not kwargs.get('noClassRegister', False) else 0
 
     def getUUID(self):
-        return self._uuid.copy()
+        return self._uuid
 
     def setUUID(self, inUUID):
-        if type(inUUID) is NString:
-            self._uuid = inUUID
-        else:
-            self._uuid = NString(inUUID)
+        """
+        :param inUUID: An NUUID, an int or the string form of a UUID.
+        """
+        prevUUID = self._uuid
+        self._uuid = inUUID if type(inUUID) is NUUID else NUUID(inUUID)
+
+        if GA.getInstance(prevUUID) is self:
+            GA.swapInstanceKey(prevUUID)
+
+    def getHandle(self):
+        """
+        Get the handle this object is registered under. Unlike a UUID, it stops resolving as soon as the object is unregistered.
+        :return: The handle, 0 if this object isn't registered.
+        """
+        return self._registryHandle
 
     def getName(self):
         return self._name.copy()
@@ -52,6 +70,8 @@ class NObject(object):
         else:
             self._name = NString(str(inName))
 
+        GA.renameInstance(self)
+
     def getOwner(self):
         """
         Get the object that owns this, if defined. Can be None.
@@ -62,6 +82,52 @@ class NObject(object):
     def getWorld(self):
         return self._world
 
+    @staticmethod
+    def _track(table: dict, obj):
+        key = id(obj)
+        # The entry removes itself once the object is collected.
+        table[key] = NWeakRef(obj, lambda ref: table.pop(key, None))
+
+    def _adopt(self, obj):
+        if self._owned is None:
+            self._owned = {}
+
+        NObject._track(self._owned, obj)
+
+    def _trackConnection(self, boundMethod):
+        """
+        Called by the BoundMethods linked to this object, so that destroy() can disconnect them.
+        """
+        if self._connections is None:
+            self._connections = {}
+
+        NObject._track(self._connections, boundMethod)
+
+    def destroy(self):
+        """
+        Tear this object down: remove the connections targeting it from their delegates, then unregister and destroy the objects it owns.
+        It only walks this object's own edges. Called by global_accessor.killInstance().
+        """
+        connections, self._connections = self._connections, None
+        for ref in list(connections.values()) if connections else ():
+            bm = ref()
+            delegate = bm.getDelegate() if bm is not None and bm._owningDelegate else None
+            if delegate is not None:
+                delegate.connectionDied(bm)
+
+        owned, self._owned = self._owned, None
+        for ref in list(owned.values()) if owned else ():
+            obj = ref()
+            if obj is not None:
+                GA.removeInstance(obj.getUUID())
+                obj.destroy()
+
+    def getSerializedProps(self):
+        """
+        Get the names of the properties flagged as serializable that this object holds, in the order they are serialized.
+        """
+        return [x for x in self.__PropFlags__.serial if hasattr(self, x)]
+
     def __archive__(self, Ar: NArchive):
         """
         Automatically serializes any property that is marked as serializable using EAttrType.AT_Serializable when declaring the attribute.
@@ -75,27 +141,28 @@ class NObject(object):
             # If owner is None (and should never be for nested objects) it will cause a deserialization error.
             OwnAr << NString('object_begin')
 
-        for prop in dir(self):
-            __propFlags = self.__PropFlags__.get(prop, ())
-            if EAttrType.AT_Serializable in __propFlags:
-                propInst = getattr(self, prop)
-                if propInst is not None:
-                    # Do not recursively serialize NObjects. Only properties.
-                    # Get UUID for objects unless they're declared as persistent, in which case serialize.
-                    if isinstance(propInst, NObject) and EAttrType.AT_Persistent not in __propFlags:
-                        OwnAr << propInst.getUUID()
-                    elif isinstance(propInst, str):
-                        obj = NString(propInst)
-                        OwnAr << obj
-                    elif isinstance(propInst, float):
-                        obj = NFloat(propInst)
-                        OwnAr << obj
-                    elif isinstance(propInst, (int, bool)):
-                        obj = NInt(propInst)
-                        OwnAr << obj
-
-                    else:
-                        OwnAr << propInst
+        for prop in self.getSerializedProps():
+            __propFlags = self.__PropFlags__[prop]
+            propInst = getattr(self, prop)
+            if propInst is not None:
+                # Do not recursively serialize NObjects. Only properties.
+                # Get UUID for objects unless they're declared as persistent, in which case serialize.
+                if isinstance(propInst, NObject) and EAttrType.AT_Persistent not in __propFlags:
+                    OwnAr << propInst.getUUID()
+                elif isinstance(propInst, NUUID):
+                    OwnAr << propInst
+                elif isinstance(propInst, str):
+                    obj = NString(propInst)
+                    OwnAr << obj
+                elif isinstance(propInst, float):
+                    obj = NFloat(propInst)
+                    OwnAr << obj
+                elif isinstance(propInst, (int, bool)):
+                    obj = NInt(propInst)
+                    OwnAr << obj
+
+                else:
+                    OwnAr << propInst
 
         if self.getOwner() is not None:
             # Write header for nested objects.
@@ -111,72 +178,78 @@ class NObject(object):
         :type data: iterable.
         :return: the new Archive position after computation.
         """
-        prevUUID = self._uuid.copy()
+        prevUUID = self._uuid
         idx = 0
-        print("Data for %s: %s" % (self.getName(), data))
-        values = struct.unpack_from(data[0][0], data[0][1], 0)
+        if LOG.bDebug:
+            LOG.debug("Data for %s: %s", self.getName(), data)
+        values = getStruct(data[0][0]).unpack_from(data[0][1], 0)
         # print(values)
-        num = len(values); print(num)
+        num = len(values)
         PendingArrays = []
-        for prop in dir(self):
+        for prop in self.getSerializedProps():
             if idx < num:
-                __propFlags = self.__PropFlags__.get(prop, ())
-                if EAttrType.AT_Serializable in __propFlags:
-                    obj = getattr(self, prop)
-                    typ = 0
-
-                    #  Explicitly cast from the base type to the mutable type
-                    #  in order to deserialize the value properly.
-
-                    if type(obj) is str:
-                        obj = NString(obj)
-                        typ = 1
-                    elif type(obj) is float:
-                        obj = NFloat(obj)
-                        typ = 2
-                    elif type(obj) is int:
-                        obj = NInt(obj)
-                        typ = 3
-                    elif type(obj) is bool:
-                        obj = NInt(obj)
-                        typ = 4
-
-                    val = values[idx] if not hasattr(values[idx], 'decode') else values[idx].decode()
-                    print("DESERIALIZED VALUES FOR %s: %s" % (self.getName(), values))
-                    print("VALUE = %s, PROPERTY = %s.%s" % (obj, self.getName(), prop))
-                    # assert obj, "Error: %s.%s is not properly initialized, but was serialized previously." % (self.__class__.__name__, prop)
-
-                    if hasattr(obj, '__reader__'):
-                        # print(prop, val)
-                        obj.__reader__(val)
-                        idx += 1
-                    elif hasattr(obj, '__binaryreader__'):
-                        print(val)
-                        if val == 'array_begin':
-                            endArray = values.index('array_end'.encode()); assert endArray != -1  # should never be false
-                            dt = values[idx+1:endArray]
-                            PendingArrays.append([idx, endArray, dt, obj])
-
-                            # Make sure to offset the read index, as the order is sensitive.
-                            # Objects MUST be deserialized in the exact order they were serialized.
-                            idx += endArray + 1
-
-                        elif val == 'object_begin':
-                            endObject = values.index('object_end'.encode()); assert endObject != -1  # should never be false
-                            dt = values[idx+1:endObject]
-                            print("DATA FOR %s ====> %s" % (self, dt) )
-                            obj.__binaryreader__(dt)
-                            idx += endObject + 1
-                    else:
-                        assert 0, '%s' % obj.__class__.__name__
-
-                    if typ != 0:
-                        d = {1: str, 2: float, 3: int, 4: bool}
-                        # Explicit cast from the mutable NNumeric to the actual property,
-                        # because these defaults are NOT mutable and therefore are unaffected by NArchive.
-                        setattr(self, prop, d[typ](obj))
+                obj = getattr(self, prop)
+                typ = 0
+
+                #  Explicitly cast from the base type to the mutable type
+                #  in order to deserialize the value properly.
+
+                if type(obj) is str:
+                    obj = NString(obj)
+                    typ = 1
+                elif type(obj) is float:
+                    obj = NFloat(obj)
+                    typ = 2
+                elif type(obj) is int:
+                    obj = NInt(obj)
+                    typ = 3
+                elif type(obj) is bool:
+                    obj = NInt(obj)
+                    typ = 4
+                elif type(obj) is NUUID:
+                    # UUIDs are archived in their string form.
+                    obj = NString(obj.toString())
+                    typ = 5
+
+                val = values[idx] if not hasattr(values[idx], 'decode') else values[idx].decode()
+                if LOG.bDebug:
+                    LOG.debug("DESERIALIZED VALUES FOR %s: %s", self.getName(), values)
+                    LOG.debug("VALUE = %s, PROPERTY = %s.%s", obj, self.getName(), prop)
+                # assert obj, "Error: %s.%s is not properly initialized, but was serialized previously." % (self.__class__.__name__, prop)
+
+                if hasattr(obj, '__reader__'):
+                    # print(prop, val)
+                    obj.__reader__(val)
+                    idx += 1
+                elif hasattr(obj, '__binaryreader__'):
+                    if val == 'array_begin':
+                        endArray = values.index('array_end'.encode()); assert endArray != -1  # should never be false
+                        dt = values[idx+1:endArray]
+                        PendingArrays.append([idx, endArray, dt, obj])
+
+                        # Make sure to offset the read index, as the order is sensitive.
+                        # Objects MUST be deserialized in the exact order they were serialized.
+                        idx += endArray + 1
+
+                    elif val == 'object_begin':
+                        endObject = values.index('object_end'.encode()); assert endObject != -1  # should never be false
+                        dt = values[idx+1:endObject]
+                        if LOG.bDebug:
+                            LOG.debug("DATA FOR %s ====> %s", self, dt)
+                        obj.__binaryreader__(dt)
+                        idx += endObject + 1
+                else:
+                    assert 0, '%s' % obj.__class__.__name__
+
+                if typ != 0:
+                    d = {1: str, 2: float, 3: int, 4: bool, 5: NUUID}
+                    # Explicit cast from the mutable NNumeric to the actual property,
+                    # because these defaults are NOT mutable and therefore are unaffected by NArchive.
+                    setattr(self, prop, d[typ](obj))
 
         GA.swapInstanceKey(prevUUID)
+        # The name was read in place, without setName().
+        GA.renameInstance(self)
 
         # Arrays must be regenerated at the end of the properties parsing, because they regenerate the items that were saved into them automatically, which
         # requires the appropriate NObject._uuid to respawn connections, for instance.
@@ -188,35 +261,43 @@ class NObject(object):
     def __jsonSerialize__(self, Serial: dict):
 
         objDict = {}
-        for prop in dir(self):
-            flags = self.__PropFlags__.get(prop, ())
-            if EAttrType.AT_Serializable in flags:
-                value = getattr(self, prop)
-                if hasattr(value, '__jsonSerialize__'):
-                    nestedObj = {}
-                    value.__jsonSerialize__(nestedObj)
-                    objDict[prop] = nestedObj
-                elif isinstance(value, (int, str, dict, list, tuple, float, bool)):
-                    objDict[prop] = value
-
-        Serial[self.getUUID()] = objDict
+        for prop in self.getSerializedProps():
+            value = getattr(self, prop)
+            if isinstance(value, NUUID):
+                objDict[prop] = value.toString()
+            elif isinstance(value, NStream):
+                # Streams are saved as the list of their items, and read back as such.
+                objDict[prop] = value.toList()
+            elif hasattr(value, '__jsonSerialize__'):
+                nestedObj = {}
+                value.__jsonSerialize__(nestedObj)
+                objDict[prop] = nestedObj
+            elif isinstance(value, (int, str, dict, list, tuple, float, bool)):
+                objDict[prop] = value
+
+        Serial[self.getUUID().toString()] = objDict
 
     def __jsonReader__(self, myDict: dict):
-        prevUUID = self._uuid.copy()
-
-        for prop in dir(self):
-            flags = self.__PropFlags__.get(prop, ())
-            if EAttrType.AT_Serializable in flags:
-                value = getattr(self, prop)
-                if hasattr(value, '__jsonReader__'):
-                    value.__jsonReader__(myDict[prop])
-                elif isinstance(value, (int, str, dict, list, tuple, float, bool)):
-                    setattr(self, prop, myDict[prop])
+        prevUUID = self._uuid
+
+        for prop in self.getSerializedProps():
+            value = getattr(self, prop)
+            if isinstance(value, NUUID):
+                # Older files hold an empty entry for UUIDs.
+                if isinstance(myDict[prop], str):
+                    setattr(self, prop, NUUID(myDict[prop]))
+            elif hasattr(value, '__jsonReader__'):
+                value.__jsonReader__(myDict[prop])
+            elif isinstance(value, (int, str, dict, list, tuple, float, bool)):
+                setattr(self, prop, myDict[prop])
 
         g_a.swapInstanceKey(prevUUID)
+        # The name was read in place, without setName().
+        g_a.renameInstance(self)
 
     def __str__(self):
         return "\"%s\" type <'%s'> with ID %s" % (self.getName(), self.__class__.__name__, self.getUUID())
 
     def __del__(self):
-        print("Destroying %s" % self)
+        if LOG.bDebug:
+            LOG.debug("Destroying %s", self)
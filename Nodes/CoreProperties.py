@@ -3,12 +3,12 @@ from __future__ import division
 from functools import reduce
 import math
 from numbers import Real
-import array, struct, collections, os, subprocess, warnings
+import array, struct, collections, os, subprocess, warnings, uuid, mmap, io, itertools, sys, tempfile, functools, stat
 
-from PySide2.QtCore import QPoint, QPointF
 import global_accessor as GA
+from Nodes.CoreLog import LOG
 from Nodes.Decorators import *
-from Nodes.WeakReferences import NWeakRef, NWeakMethod
+from Nodes.WeakReferences import NWeakRef, NWeakMethod, objectRef
 
 # Define various macros...
 EXPOSEDPROPNAME = "propTypes"
@@ -82,6 +82,8 @@ class Error_Type(object):
 
 
 class NProperty(object):
+    __slots__ = ()
+
     def __init__(self, *args, **kwargs):
         CLASS_PROP_BODY(self)
 
@@ -138,6 +140,29 @@ class TEnum(NProperty):
 
 
 
+@functools.lru_cache(maxsize=1024)
+def getStruct(fmt: str):
+    """
+    Get the compiled struct.Struct of a format. Compiled structs are shared through a bounded LRU cache,
+    so that serialization doesn't parse formats again for every value.
+    """
+    return struct.Struct(fmt)
+
+
+@functools.lru_cache(maxsize=1024)
+def _isUnpadded(fmt: str):
+    """
+    Whether a format has the same layout with standard sizes and no alignment. Formats already prefixed with '=' always do.
+    """
+    return fmt[:1] == '=' or getStruct(fmt).size == getStruct('=' + fmt).size
+
+
+# Structs of the fixed-size mutable types.
+_INT_STRUCT = struct.Struct('i')
+_FLOAT_STRUCT = struct.Struct('d')
+_STATUS_STRUCT = struct.Struct('I')
+
+
 class NArchive(NProperty):
     """
     Archive class. Used for serializing data into binary. Can be dumped into a binary file.
@@ -145,12 +170,20 @@ class NArchive(NProperty):
     NArchive can be converted into byteArrays (in a tuple holding the sequence buffer and the data itself) in order to be quickly
     convertible / transmittable if needed.
 
+    Data is appended to a single byte buffer, along with a table holding the struct format and the extent of every entry.
+    Entries are laid out without alignment padding, so that archives can be combined and nested by copying their bytes.
+
     Use NMemoryReader in order to read from byte arrays or byte sequences. NArchive serializes data into byte sequences that can then be converted into
     byte arrays using NArchive.toByteArrays().
     """
     def __init__(self, inAr=None):
         super(NArchive, self).__init__()
-        self._byteBuffers = [] if inAr is None else inAr
+        self._data = bytearray()
+        # (format, start, end) of every entry in _data.
+        self._table = []
+        for buffer, data in inAr if inAr else ():
+            self._append(buffer, data)
+
         self.position = 0
 
     def __lshift__(self, other):
@@ -162,67 +195,57 @@ class NArchive(NProperty):
 
     def __add__(self, buffer):
         if isinstance(buffer, tuple) and len(buffer) == 2:
-            self._byteBuffers.append(buffer)
+            self._append(*buffer)
             self.position += 1
 
         elif isinstance(buffer, NArchive):
-            self._byteBuffers.extend(buffer.getData())
+            offset = len(self._data)
+            self._data += buffer._data
+            self._table.extend((fmt, start + offset, end + offset) for fmt, start, end in buffer._table)
             self.position += 1
         else:
             raise TypeError("Invalid input: buffer must be a tuple holding the buffer and the binary data.")
 
+        return self
+
+    def _append(self, buffer: str, data):
+        if not _isUnpadded(buffer):
+            # Native alignment padded this entry: repack it with standard sizes.
+            data = getStruct('=' + buffer).pack(*getStruct(buffer).unpack(data))
+            buffer = '=' + buffer
+
+        start = len(self._data)
+        self._data += data
+        self._table.append((buffer, start, len(self._data)))
+
     def combine(self, recursiveVal=None):
         """
-        Combine the entire archive into a single binary. This is a rather slow operation as it deserialize, converts and re-serializes the data.
+        Combine the entire archive into a single entry. The bytes are kept as they are: only the formats are joined.
         :return: the new archive with a combined buffer.
         """
-        dataTMp = []
-        for buffer, data in self._byteBuffers if not recursiveVal else recursiveVal:
-            data = struct.unpack(buffer, data)
-            if len(data) == 1:
-                if hasattr(data[0], 'decode'):
-                    data = data[0].decode()
-                else:
-                    data = data[0]
-
-            tmp = (buffer, data)
-            dataTMp.append(tmp)
-
-        combinedBuffer = ''
-        combinedValues = []
-        for buff, value in dataTMp:
-            combinedBuffer += buff
-            if isinstance(value, tuple):
-                combinedValues.extend(list(value))
-            elif hasattr(value, 'encode'):
-                combinedValues.append(value.encode())
-            else:
-                combinedValues.append(value)
-
-        # print(combinedBuffer, combinedValues)
-        outData = (combinedBuffer, struct.pack(combinedBuffer, *combinedValues))
-        outData = [outData]
+        source = self if not recursiveVal else NArchive(recursiveVal)
 
-        # print(outData)
+        out = NArchive()
+        out._data = source._data[:]
+        out._table.append(('=' + ''.join(fmt.lstrip('=') for fmt, start, end in source._table), 0, len(out._data)))
 
-        return NArchive(outData)
+        return out
 
     def toByteArrays(self, bFromStart=False):
-        if not NArchive.ensure(self._byteBuffers, array.array):
-            res = []
-            for item in self._byteBuffers[self.position if not bFromStart else 0::]:
-                s = struct.Struct(item[0])
-                ar = array.array('I', [0] * s.size)
-                data = s.unpack(item[1])
-                s.pack_into(ar, 0, *data)
-                res.append((item[0], ar))
-
-            return res
-        else:
-            return self._byteBuffers
+        """
+        Get the entries of this archive as (format, memoryview) tuples, without copying their bytes.
+        The archive cannot grow while the views are alive.
+        :param bFromStart: Start from the first entry rather than from the current position.
+        """
+        view = memoryview(self._data)
+        return [(fmt, view[start:end]) for fmt, start, end in self._table[self.position if not bFromStart else 0::]]
 
     def getData(self):
-        return self._byteBuffers
+        """
+        :return: The entries of this archive, as a list of tuples holding the struct format and the packed bytes.
+        """
+        data = self._data
+        return [(fmt, bytes(data[start:end])) for fmt, start, end in self._table]
 
     @staticmethod
     def ensure(inList, classType, position=1):
@@ -243,90 +266,144 @@ class NArchive(NProperty):
     def intSize():
         return 12
 
-    def writeToFile(self, binary_file, objName):
-        # Write all the data contained in our buffer
-        byteInfo = []
+    def toChunk(self, objName: str):
+        """
+        Assemble the file chunk of this archive, as written by writeToFile().
+        The chunk holds its size, every entry's format and data, then its header: the size of every part, their count, and the object name.
+        :return: The chunk bytes.
+        """
         int_size = NArchive.intSize()
-        start_position = binary_file.seek(0, 1)
-        # preallocate int_size bits to write the chunk size at the end.
-        count = binary_file.write(b'0'.zfill(int_size))
-        for buffer, data in self.getData():
-            byteInfo.append(binary_file.write(buffer.encode()))
-            count += byteInfo[-1]
-            byteInfo.append(binary_file.write(data))
-            count += byteInfo[-1]
+        view = memoryview(self._data)
+        parts = [None]
+        byteInfo = []
+        for fmt, start, end in self._table:
+            fmt = fmt.encode()
+            parts.append(fmt); byteInfo.append(len(fmt))
+            parts.append(view[start:end]); byteInfo.append(end - start)
+
+        # Write header of this chunk at the end, that way we know where the 'block' exactly begins.
+        binLen = len(byteInfo)
+        posData = getStruct('%dI' % binLen).pack(*byteInfo)
+        name = objName.encode()
+        parts.extend((posData, len(posData).to_bytes(int_size, 'big', signed=False), binLen.to_bytes(int_size, 'big', signed=False),
+                      name, len(name).to_bytes(int_size, 'big', signed=False)))
+        count = int_size + sum(byteInfo) + len(posData) + int_size*3 + len(name)
+        parts[0] = count.to_bytes(int_size, 'big', signed=False)
+
+        return b''.join(parts)
+
+    def writeToFile(self, binary_file, objName, bFlush=True):
+        """
+        Write this archive as a chunk, in a single write.
+        :param bFlush: Flush the file afterwards. Disable it when writing several archives in a row.
+        """
+        binary_file.write(self.toChunk(objName))
+        if bFlush:
             binary_file.flush()
 
-        # print(byteInfo)
+    @staticmethod
+    def saveFile(path: str, archives, bAtomic=False):
+        """
+        Write archives to a file, in a single write.
+        :param archives: Iterable of (object name, NArchive).
+        :param bAtomic: Write to a temporary file next to path, then rename it, so that path never holds a partially written file.
+        """
+        NArchive.writeBytes(path, [archive.toChunk(name) for name, archive in archives], bAtomic)
 
-        # Write header of this file at the end, that way we know where the 'block' exactly begins.
-        binLen = len(byteInfo)
-        buff = '%dI' % binLen
-        # write position data from list
-        byteInfoLen = binary_file.write(struct.pack(buff, *byteInfo)); count += byteInfoLen
-        # write length of position data
-        count += binary_file.write(byteInfoLen.to_bytes(int_size, 'big', signed=False))
-        # write length of buffer for position data, into int_size bits
-        count += binary_file.write(binLen.to_bytes(int_size, 'big', signed=False))
-        # write object name
-        nameLen = binary_file.write(objName.encode()); count += nameLen
-
-        # write object name length, into int_size bits
-        add = binary_file.write(nameLen.to_bytes(int_size, 'big', signed=False)); count += add
-        # now use the preallocated 12 bits to write the length of this chunk.
-        binary_file.seek(start_position, 0)
-        binary_file.write(count.to_bytes(int_size, 'big', signed=False))
-        binary_file.seek(count + start_position)
-        binary_file.flush()
+    @staticmethod
+    def writeBytes(path: str, chunks, bAtomic=False):
+        """
+        Write a list of bytes to a file with a single write and a single flush.
+        :param bAtomic: Write to a temporary file next to path, then rename it over path.
+        """
+        if not bAtomic:
+            with open(path, 'wb') as f:
+                f.write(b''.join(chunks))
+            return
+
+        fd, tmpPath = tempfile.mkstemp(prefix='.%s.' % os.path.basename(path), suffix='.tmp', dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b''.join(chunks))
+                f.flush()
+                os.fsync(f.fileno())
+
+            # mkstemp creates the file readable by its owner only: give it the mode path has, or would get if created with open().
+            os.chmod(tmpPath, NArchive._fileMode(path))
+            os.replace(tmpPath, path)
+        except BaseException:
+            os.remove(tmpPath)
+            raise
+
+    @staticmethod
+    def _fileMode(path: str):
+        """
+        :return: The permission bits of the file at path, or those of a new file under the current umask if it doesn't exist.
+        """
+        try:
+            return stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            return 0o666 & ~umask
+
+    @staticmethod
+    def mapFile(binary_file):
+        """
+        Get the content of a file as a read-only buffer. Files on disk are memory-mapped rather than read.
+        :return: An mmap, or bytes for streams that cannot be mapped.
+        """
+        try:
+            return mmap.mmap(binary_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            # Empty files and in-memory streams cannot be mapped.
+            binary_file.seek(0, 0)
+            return binary_file.read()
 
     @staticmethod
     def decodeFile(binary_file):
+        """
+        Index the chunks of a file written by writeToFile().
+        The file is mapped, and every chunk is read in place from it: no chunk data is copied.
+        :return: dict of object name -> NMemoryReader positioned on the first entry of the object.
+        """
         pos = 0
         output = {}
-        all_data = binary_file.read()
-        # print(all_data)
+        # Chunks of a file mostly share the same few formats.
+        formats = {}
+        all_data = NArchive.mapFile(binary_file)
         j = len(all_data)
-        # print(j)
         int_size = NArchive.intSize()
 
         while pos < j:
-            # Get the header for chunk x
-            binary_file.seek(pos, 0)
-            chnkSize = int.from_bytes(binary_file.read(int_size), 'big', signed=False)
-            binary_file.seek(pos+chnkSize-int_size, 0)
-            name_len = int.from_bytes(binary_file.read(int_size), 'big', signed=False)
-            binary_file.seek(-(name_len+int_size), 1)
-            objName = binary_file.read(name_len).decode()
-            binary_file.seek(-(int_size+name_len), 1)
-            posBufferLen = int.from_bytes(binary_file.read(int_size), 'big', signed=False)
-            binary_file.seek(-int_size*2, 1)
-            posDataLen = int.from_bytes(binary_file.read(int_size), 'big', signed=False)
-            binary_file.seek(-(int_size+posDataLen), 1)
-            posData = struct.unpack('%dI' % posBufferLen, binary_file.read(posDataLen))
-
-            # get the serialized properties data
+            # The header of a chunk is stored at its end: position data, their lengths, then the object name and its length.
+            chnkSize = int.from_bytes(all_data[pos:pos+int_size], 'big', signed=False)
+            end = pos + chnkSize
+            name_len = int.from_bytes(all_data[end-int_size:end], 'big', signed=False)
+            nameStart = end - int_size - name_len
+            objName = all_data[nameStart:end-int_size].decode()
+            posBufferLen = int.from_bytes(all_data[nameStart-int_size:nameStart], 'big', signed=False)
+            posDataLen = int.from_bytes(all_data[nameStart-int_size*2:nameStart-int_size], 'big', signed=False)
+            posData = getStruct('%dI' % posBufferLen).unpack_from(all_data, nameStart - int_size*2 - posDataLen)
+
+            # Index the serialized properties data, stored as (format, data) pairs.
             s = pos + int_size
-            binary_file.seek(s, 0)  # move back at the start of the chunk, offset with the chunk size data
-            data = []
-            buffers = []
-            i = 0
-            for p in posData:
-                # print(binary_file.read(p))
-                if i % 2 == 0:
-                    buffers.append(binary_file.read(p).decode())
-                else:
-                    data.append(binary_file.read(p))
-                binary_file.seek(s+p, 0)
-                i += 1
-                s += p
-
-            outdata = []
-            for buffer, binary in zip(buffers, data):
-                outdata.append((buffer, binary))
-
-            output[objName] = outdata
-            # print(pos)
-            pos += chnkSize
+            formatList = []
+            bounds = array.array('q')
+            for i in range(0, len(posData) - 1, 2):
+                bufferEnd = s + posData[i]
+                dataEnd = bufferEnd + posData[i+1]
+                raw = all_data[s:bufferEnd]
+                fmt = formats.get(raw, None)
+                if fmt is None:
+                    fmt = formats[raw] = raw.decode()
+
+                formatList.append(fmt)
+                bounds.append(bufferEnd); bounds.append(dataEnd)
+                s = dataEnd
+
+            output[objName] = NMemoryReader(all_data, formatList, bounds)
+            pos = end
 
         return output
 
@@ -334,43 +411,53 @@ class NArchive(NProperty):
 class NMemoryReader(NArchive):
     """
     Use NMemoryReader to deserialize data from byte arrays or byte sequences.
-    Upon construction, NMemoryReader expects a tuple of byteArrays or byte sequences to operate with.
+    Upon construction, NMemoryReader expects a tuple of byteArrays or byte sequences to operate with, an NArchive,
+    or a single buffer (bytes, bytearray, mmap...) along with the formats and the bounds of its entries.
+    Data is decoded in place from a memoryview of a single buffer.
     Use "<<" to deserialize data from NMemoryReader. Make sure to deserialize data in the exact order it was serialized with,
     or the results will be incorrect.
     Classes must implement __reader__(data) or __binaryreader__(data) in order to read data from NMemoryReader.
     """
-    def __init__(self, inBuffer: (tuple, array.array)):
+    def __init__(self, inBuffer, formats=None, bounds=None):
+        """
+        :param inBuffer: A list of (format, data) tuples, an NArchive or a single buffer.
+            An NArchive is read in place, so it cannot grow while the reader is alive.
+        :param formats: With a single buffer, the struct format of every entry.
+        :param bounds: With a single buffer, the start and end offsets of every entry, one after the other.
+        """
         super(NMemoryReader, self).__init__()
-        bUseBytes = False
-        if len(inBuffer) != 0:
-            if NMemoryReader.ensure(inBuffer, array.array):
-                self._byteBuffers = inBuffer
-                bUseBytes = True
-            elif NMemoryReader.ensure(inBuffer, tuple):
-                self._byteBuffers = inBuffer
-            else:
+        if isinstance(inBuffer, NArchive):
+            formats = [fmt for fmt, start, end in inBuffer._table]
+            bounds = array.array('q', itertools.chain.from_iterable((start, end) for fmt, start, end in inBuffer._table))
+            inBuffer = inBuffer._data
+
+        elif formats is None:
+            # (format, data) tuples: gather their data into a single buffer.
+            try:
+                formats = [fmt for fmt, data in inBuffer]
+                datas = [data for fmt, data in inBuffer]
+            except (TypeError, ValueError):
                 raise RuntimeError("%s is not properly initialized. Input buffer is invalid." % self.__class__.__name__)
 
-        self.__memoryType = int(bUseBytes)
+            bounds = array.array('q')
+            offset = 0
+            for data in datas:
+                size = memoryview(data).nbytes
+                bounds.append(offset); offset += size; bounds.append(offset)
 
+            inBuffer = b''.join(datas)
+
+        self._view = memoryview(inBuffer).cast('B')
+        self._formats = formats
+        self._bounds = bounds
 
     def __lshift__(self, other):
         self._deserialize(other)
 
     def _deserialize(self, item):
         if hasattr(item, "__reader__"):
-            # If memory is bytes buffer
-            if self.__memoryType == 1:
-                data = self._byteBuffers[self.position]
-                unpackedBin = struct.unpack_from(data[0], data[1], 0)
-                item.__reader__(unpackedBin)
-
-            # If memory is bytes sequence
-            elif self.__memoryType == 0:
-                data = self._byteBuffers[self.position]
-                unpackedBin = struct.unpack(data[0], data[1])
-                item.__reader__(unpackedBin)
-
+            idx = self.position
+            item.__reader__(getStruct(self._formats[idx]).unpack_from(self._view, self._bounds[idx*2]))
             self.position += 1
 
         elif hasattr(item, '__binaryreader__'):
@@ -383,17 +470,327 @@ class NMemoryReader(NArchive):
         else:
             raise TypeError("%s does not implement __reader__(data) or __binaryreader__(data)." % item.__class__.__name__)
 
+    def toByteArrays(self, bFromStart=False):
+        """
+        Get the entries from the current position, as (format, memoryview) tuples over the buffer.
+        """
+        view, bounds = self._view, self._bounds
+        return [(self._formats[idx], view[bounds[idx*2]:bounds[idx*2+1]]) for idx in range(self.position if not bFromStart else 0, len(self._formats))]
+
+    def getData(self):
+        return self.toByteArrays(True)
+
     def seek(self, pos):
-        if pos < len(self._byteBuffers):
+        if pos < len(self._formats):
             self.position = pos
         else:
             raise IndexError("Ensure condition failed: position < len(byteBuffer) != True")
 
 
+# Archive file layout. See NArchiveFile.
+_FILE_MAGIC = b'NPAF'
+_FILE_HEADER = struct.Struct('<4sHHII')
+_FILE_TOC_ENTRY = struct.Struct('<16sQQHHH')
+# Table of contents entry of version 1 files, which have no class info.
+_FILE_TOC_ENTRY_V1 = struct.Struct('<16sQQHH')
+_FILE_CHUNK_HEADER = struct.Struct('<II')
+_FILE_LINKS_HEADER = struct.Struct('<II')
+_FILE_LINK = struct.Struct('<16s16sHH')
+
+
+class NArchiveFile(object):
+    """
+    Versioned container of archived objects, indexed by a table of contents at the start of the file.
+    Opening a file only reads its table of contents: objects are then decoded one by one, on demand, from the memory-mapped file.
+
+    Layout, little-endian:
+        header: magic, version, reserved, object count, table of contents size.
+        table of contents, per object: UUID, chunk offset, chunk length, class name size, class info size, object name size,
+            class name, class info, object name. The class info is the second item of NFunctionBase.classInfo(), such as the
+            name of the function an NFunctionWrapper wraps. Version 1 files have no class info.
+        links: link count, links size, then per link: source UUID, target UUID, source attribute size, target attribute size,
+            source attribute, target attribute. Versions 1 and 2 have no links.
+        chunk, per object: entry count, formats size, formats separated by null characters, start and end offsets of the entries
+            as int64, then the entries' data.
+    Links record how the objects are connected, such as the connections of a graph. The file only stores them.
+
+    Close opened files with close(), or use them as context managers: the mapping keeps the file open, which keeps it from being
+    replaced on Windows.
+    """
+    VERSION = 3
+
+    def __init__(self):
+        # UUID -> (chunk offset, chunk length, class name, object name, class info).
+        self._toc = {}
+        # Objects added for writing, as (UUID, class name, object name, NArchive, class info).
+        self._pending = []
+        # (source UUID, source attribute, target UUID, target attribute).
+        self._links = []
+        # Content of the opened file.
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Release the mapping of an opened file. Readers returned by getReader() must not be used afterwards.
+        """
+        if self._data is not None and hasattr(self._data, 'close'):
+            self._data.close()
+
+        self._data = None
+
+    def __len__(self):
+        return len(self._toc) + len(self._pending)
+
+    def __contains__(self, uuid):
+        return NArchiveFile._key(uuid) in self._toc
+
+    @staticmethod
+    def _key(uuid):
+        return uuid if isinstance(uuid, int) else NUUID(uuid)
+
+    def add(self, obj, archive: NArchive = None):
+        """
+        Add an object to write.
+        :param obj: The NObject to add.
+        :param archive: The archive holding the object's data. The object is archived if not specified.
+        """
+        if archive is None:
+            archive = NArchive()
+            archive << obj
+
+        info = obj.classInfo()[1] if hasattr(obj, 'classInfo') else 0
+        self._pending.append((obj.getUUID(), obj.__class__.__name__, obj.getName().toString(), archive, str(info) if info else ''))
+
+    def addLink(self, source, sourceAttr: str, target, targetAttr: str):
+        """
+        Record a link between two objects, by UUID.
+        """
+        self._links.append((NArchiveFile._key(source), str(sourceAttr), NArchiveFile._key(target), str(targetAttr)))
+
+    def getLinks(self):
+        """
+        :return: The links of the file, as (source UUID, source attribute, target UUID, target attribute).
+        """
+        return list(self._links)
+
+    @staticmethod
+    def _packChunk(archive: NArchive):
+        table = archive._table
+        formats = '\0'.join(fmt for fmt, start, end in table).encode()
+        bounds = array.array('q', itertools.chain.from_iterable((start, end) for fmt, start, end in table))
+        if sys.byteorder != 'little':
+            bounds.byteswap()
+
+        return b''.join((_FILE_CHUNK_HEADER.pack(len(table), len(formats)), formats, bounds.tobytes(), archive._data))
+
+    def _assemble(self):
+        """
+        :return: The parts of the file, in order.
+        """
+        chunks = [NArchiveFile._packChunk(archive) for uuid, className, name, archive, info in self._pending]
+        toc = []
+        for (uuid, className, name, archive, info), chunk in zip(self._pending, chunks):
+            toc.append([uuid.to_bytes(16, 'big'), len(chunk), className.encode(), info.encode(), name.encode()])
+
+        links = []
+        for source, sourceAttr, target, targetAttr in self._links:
+            sourceAttr, targetAttr = sourceAttr.encode(), targetAttr.encode()
+            links.append(b''.join((_FILE_LINK.pack(source.to_bytes(16, 'big'), target.to_bytes(16, 'big'), len(sourceAttr), len(targetAttr)),
+                                   sourceAttr, targetAttr)))
+        links = b''.join(links)
+
+        tocSize = sum(_FILE_TOC_ENTRY.size + len(className) + len(info) + len(name) for uuid, length, className, info, name in toc)
+        offset = _FILE_HEADER.size + tocSize + _FILE_LINKS_HEADER.size + len(links)
+        out = [_FILE_HEADER.pack(_FILE_MAGIC, NArchiveFile.VERSION, 0, len(toc), tocSize)]
+        for uuid, length, className, info, name in toc:
+            out.append(_FILE_TOC_ENTRY.pack(uuid, offset, length, len(className), len(info), len(name)))
+            out.append(className)
+            out.append(info)
+            out.append(name)
+            offset += length
+
+        out.append(_FILE_LINKS_HEADER.pack(len(self._links), len(links)))
+        out.append(links)
+        out.extend(chunks)
+        return out
+
+    def writeToFile(self, binary_file):
+        """
+        Write the added objects to a binary file, in a single write.
+        """
+        binary_file.write(b''.join(self._assemble()))
+        binary_file.flush()
+
+    def save(self, path: str, bAtomic=False):
+        """
+        Write the added objects to a file. See NArchive.writeBytes().
+        """
+        NArchive.writeBytes(path, self._assemble(), bAtomic)
+
+    @staticmethod
+    def isArchiveFile(path: str):
+        """
+        :return: Whether the file at path starts like a file written by NArchiveFile.
+        """
+        with open(path, 'rb') as f:
+            return f.read(len(_FILE_MAGIC)) == _FILE_MAGIC
+
+    @staticmethod
+    def open(binary_file):
+        """
+        Map a file written by NArchiveFile.writeToFile() and read its table of contents.
+        :return: The NArchiveFile.
+        """
+        data = NArchive.mapFile(binary_file)
+        if len(data) < _FILE_HEADER.size:
+            raise RuntimeError("Not an archive file: %s is too short." % getattr(binary_file, 'name', binary_file))
+
+        magic, version, reserved, count, tocSize = _FILE_HEADER.unpack_from(data, 0)
+        if magic != _FILE_MAGIC:
+            raise RuntimeError("Not an archive file: %s." % getattr(binary_file, 'name', binary_file))
+        if version > NArchiveFile.VERSION:
+            raise RuntimeError("Archive file version %d is not supported. Latest supported version is %d." % (version, NArchiveFile.VERSION))
+
+        result = NArchiveFile()
+        result._data = data
+        pos = _FILE_HEADER.size
+        for _ in range(count):
+            if version == 1:
+                uuid, offset, length, classLen, nameLen = _FILE_TOC_ENTRY_V1.unpack_from(data, pos)
+                infoLen = 0
+                pos += _FILE_TOC_ENTRY_V1.size
+            else:
+                uuid, offset, length, classLen, infoLen, nameLen = _FILE_TOC_ENTRY.unpack_from(data, pos)
+                pos += _FILE_TOC_ENTRY.size
+
+            className = data[pos:pos+classLen].decode(); pos += classLen
+            info = data[pos:pos+infoLen].decode(); pos += infoLen
+            name = data[pos:pos+nameLen].decode(); pos += nameLen
+            result._toc[NUUID(int.from_bytes(uuid, 'big'))] = (offset, length, className, name, info)
+
+        if version >= 3:
+            count, size = _FILE_LINKS_HEADER.unpack_from(data, pos)
+            pos += _FILE_LINKS_HEADER.size
+            for _ in range(count):
+                source, target, sourceLen, targetLen = _FILE_LINK.unpack_from(data, pos)
+                pos += _FILE_LINK.size
+                sourceAttr = data[pos:pos+sourceLen].decode(); pos += sourceLen
+                targetAttr = data[pos:pos+targetLen].decode(); pos += targetLen
+                result._links.append((NUUID(int.from_bytes(source, 'big')), sourceAttr, NUUID(int.from_bytes(target, 'big')), targetAttr))
+
+        return result
+
+    def getEntries(self):
+        """
+        :return: The UUIDs of the objects in the file, in the order they were written.
+        """
+        return list(self._toc)
+
+    def getClassName(self, uuid):
+        return self._toc[NArchiveFile._key(uuid)][2]
+
+    def getClassInfo(self, uuid):
+        """
+        :return: The class info of an object, like NFunctionBase.classInfo() returns it.
+        """
+        entry = self._toc[NArchiveFile._key(uuid)]
+        return entry[2], entry[4] or 0
+
+    def getName(self, uuid):
+        return self._toc[NArchiveFile._key(uuid)][3]
+
+    def findByName(self, name: str):
+        return [uuid for uuid, entry in self._toc.items() if entry[3] == name]
+
+    def findByClass(self, className: str):
+        return [uuid for uuid, entry in self._toc.items() if entry[2] == className]
+
+    def getReader(self, uuid):
+        """
+        Get a reader on the data of an object. Only this object's chunk is decoded, in place.
+        :return: The NMemoryReader.
+        """
+        offset, length = self._toc[NArchiveFile._key(uuid)][:2]
+        view = memoryview(self._data)
+        count, formatsSize = _FILE_CHUNK_HEADER.unpack_from(view, offset)
+        pos = offset + _FILE_CHUNK_HEADER.size
+        formats = str(view[pos:pos+formatsSize], 'ascii').split('\0') if count else []
+        pos += formatsSize
+        bounds = view[pos:pos+count*16]
+        if sys.byteorder == 'little':
+            bounds = bounds.cast('q')
+        else:
+            bounds = array.array('q', bounds)
+            bounds.byteswap()
+
+        pos += count*16
+        return NMemoryReader(view[pos:offset+length], formats, bounds)
+
+    def readObject(self, uuid, obj):
+        """
+        Deserialize an object's data into obj.
+        :return: obj.
+        """
+        self.getReader(uuid) << obj
+        return obj
+
+    @staticmethod
+    def spawn(name: str, classInfo: (list, tuple)):
+        """
+        Default factory of loadObject(). Function nodes are looked up among the registered function classes and created from their name,
+        other objects among the classes registered with global_accessor and created with a name keyword.
+        :param name: The name of the new object.
+        :param classInfo: The class info, as returned by getClassInfo().
+        :return: The new object.
+        """
+        className, info = classInfo
+        cls = GA.functionClasses.get(className, None)
+        if cls is not None:
+            if not info:
+                return cls(name)
+
+            funcObj = GA.functionClasses.get(info, None)
+            if funcObj is None:
+                raise RuntimeError("%s is not registered. Cannot load %s." % (info, name))
+
+            return cls(name, funcObj)
+
+        cls = GA.findClass(className)
+        if cls is None:
+            raise RuntimeError("%s is not registered. Cannot load %s." % (className, name))
+
+        return cls(name=name)
+
+    def loadObject(self, uuid, factory=None):
+        """
+        Create an object from the class recorded in the table of contents, and read its data into it. Only this object's chunk is decoded.
+        :param uuid: The UUID of the object to load.
+        :param factory: Called with the object's name and class info to create it. Defaults to NArchiveFile.spawn().
+        :return: The new object, registered under its archived UUID.
+        """
+        key = NArchiveFile._key(uuid)
+        obj = (factory or NArchiveFile.spawn)(self.getName(key), self.getClassInfo(key))
+        self.readObject(key, obj)
+        if obj.getUUID() != key:
+            obj.setUUID(key)
+
+        return obj
+
+
 class NMutable(NProperty):
     """
     A simple mutable object holding wildcard data. Is serializable if buffer is defined.
     """
+    __slots__ = ('_data', '_buffer')
+    # Prebuilt struct of the buffer, for types whose buffer never changes.
+    _struct = None
+
     def __init__(self, v, buffer=''):
         super(NMutable, self).__init__()
         self._data = v
@@ -407,7 +804,7 @@ class NMutable(NProperty):
 
     def __archive__(self, Ar):
         if self._buffer != '':
-            Ar += (self._buffer, struct.pack(self._buffer, self._data))
+            Ar += (self._buffer, (self._struct or getStruct(self._buffer)).pack(self._data))
         else:
             raise RuntimeError("Buffer for %s is not defined." % self.__class__.__name__)
 
@@ -434,6 +831,7 @@ class NMutable(NProperty):
 
 
 class NNumeric(NMutable):
+    __slots__ = ()
 
     def __add__(self, other):
         if isinstance(other, (float, int)):
@@ -540,6 +938,9 @@ class NInt(NNumeric):
     """
     A simple mutable integer. Is serializable.
     """
+    __slots__ = ()
+    _struct = _INT_STRUCT
+
     def __init__(self, v: int = 0):
         super(NInt, self).__init__(v, 'i')
 
@@ -548,6 +949,9 @@ class NFloat(NNumeric):
     """
     A simple mutable float. Is serializable.
     """
+    __slots__ = ()
+    _struct = _FLOAT_STRUCT
+
     def __init__(self, v: float = 0.0):
         super(NFloat, self).__init__(v, 'd')
 
@@ -581,13 +985,13 @@ class ByRefVar(NProperty):
     def __init__(self, obj: object = None, var: str = ''):
         """
         Create an object that references a property on an object.
-        :param obj: The object reference. A weak reference to this object will be created when  this class is initialized.
+        :param obj: The object reference. A handle or weak reference to this object will be created when  this class is initialized.
             The object MUST be valid or an exception will be raised.
         :param var: The attribute / property name string.
         """
         super(ByRefVar, self).__init__()
 
-        self.objectRef = NWeakRef(obj) if obj else None
+        self.objectRef = objectRef(obj) if obj else None
         self.property = var
 
     def set(self, value):
@@ -622,7 +1026,7 @@ class ByRefVar(NProperty):
     def __recoverObject(self, uuid: str):
         obj = g_a.getInstance(uuid)
         if obj:
-            self.objectRef = NWeakRef(obj)
+            self.objectRef = objectRef(obj)
 
 
 class NStatus(NMutable):
@@ -630,8 +1034,11 @@ class NStatus(NMutable):
     Result status by reference. Used for delegates and such.
     Default state is EStatus.Default - meaning it was not modified.
     """
+    __slots__ = ()
+    _struct = _STATUS_STRUCT
+
     def __init__(self, v: EStatus = EStatus.Default):
-        super(NMutable, self).__init__(v, 'I')
+        super(NStatus, self).__init__(v, 'I')
 
     def isError(self):
         return self._data != EStatus.kSuccess and not self._data == EStatus.Default
@@ -648,8 +1055,9 @@ class NScript(object):
         self.setCode(script)
         self._globals = global_vars if global_vars else {}
         self._locals = local_vars if local_vars else {}
-        self._scriptThread = None
         self._bAsync = False
+        # When True, the script runs in a worker process of the shared process pool instead of this interpreter.
+        self._bProcess = False
 
         self.jobFinishedDelegate = NWeakMethod(jobFinishedCmd) if jobFinishedCmd else None
 
@@ -657,14 +1065,16 @@ class NScript(object):
             self._locals[k] = v
 
     def exec(self, bFromThread=False):
+        if self._bProcess and not bFromThread:
+            return self._execInProcess()
+
         if not self._bAsync or bFromThread:
             exec(self._script, self._globals, self._locals)
 
         elif not bFromThread and self._bAsync:
-            self._scriptThread = g_a.findClass('NThread')("tempThread_%s" % id(self), bDestroyAfterWork=True)
-            self._scriptThread.bindFinishedEvent(self, '_OnFinishedKillThread')
-            self._scriptThread.asyncTask(self)
-            self._scriptThread.start()
+            # Runs on the shared thread pool, no thread is spawned for the script.
+            from NThreads import NThreading
+            NThreading.getThreadPool().submit(self.exec, True, callback=self._OnJobFinished)
 
         return 0
 
@@ -702,13 +1112,49 @@ class NScript(object):
     def getAsync(self):
         return self._bAsync
 
-    def _OnFinishedKillThread(self, *args):
-        g_a.killInstance(self._scriptThread.getUUID())
+    def setProcess(self, v: bool):
+        self._bProcess = v
+
+    def getProcess(self):
+        return self._bProcess
+
+    def _execInProcess(self):
+        """
+        Ship the script to the process pool, along with the current value of the attributes it uses.
+        Locals that can't be sent to another process (like node references) are not available to the script.
+        Values written by the script are set back on the attributes once it is done, asynchronously if the script is async.
+        """
+        from NThreads import NProcessing
+
+        attrClass = g_a.findClass('NDynamicAttr')
+        values = {}
+        for k, v in self._locals.items():
+            if attrClass and isinstance(v, attrClass):
+                values[k] = (True, v.get())
+            elif NProcessing.isPicklable(v):
+                values[k] = (False, v)
+
+        pool = NProcessing.getProcessPool()
+        if self._bAsync:
+            pool.submit(NProcessing.runScript, self._script, values, callback=self._OnProcessFinished)
+        else:
+            self._OnProcessFinished(pool.submit(NProcessing.runScript, self._script, values).result(), bFromCaller=True)
+
+        return 0
+
+    def _OnProcessFinished(self, written, bFromCaller=False):
+        for k, v in written.items():
+            self._locals[k].set(v)
 
+        if not bFromCaller and self.jobFinishedDelegate and self.jobFinishedDelegate.isValid():
+            self.jobFinishedDelegate()()
+
+    def _OnJobFinished(self, *args):
         if self.jobFinishedDelegate and self.jobFinishedDelegate.isValid():
             self.jobFinishedDelegate()()
 
-        print("Thread finished work for script %s" % self)
+        if LOG.bDebug:
+            LOG.debug("Thread finished work for script %s", self)
 
 
 class NBatchScript(NScript):
@@ -721,16 +1167,15 @@ class NBatchScript(NScript):
     def exec(self, bFromThread=False):
         if not self._bAsync or bFromThread:
             r = subprocess.call(self._scriptdir, shell=False, stdin=subprocess.DEVNULL)
-            if not bFromThread:
-                print("Batch script <%d> finished with exit code %s." % (id(self), r))
+            if not bFromThread and LOG.bInfo:
+                LOG.info("Batch script <%d> finished with exit code %s.", id(self), r)
 
             return r
 
         elif not bFromThread and self._bAsync:
-            self._scriptThread = g_a.findClass('NThread')("tempThread_%s" % id(self), bDestroyAfterWork=True)
-            self._scriptThread.bindFinishedEvent(self, '_OnFinishedKillThread')
-            self._scriptThread.asyncTask(self)
-            self._scriptThread.start()
+            # Launched from the shared event loop: no thread is held while the process runs.
+            from NThreads import NAsync
+            NAsync.getEventLoop().runProcess([self._scriptdir], callback=self._OnJobFinished)
 
         return 0
 
@@ -744,13 +1189,12 @@ class NBatchScript(NScript):
     def __del__(self):
         os.remove(self._scriptdir)
 
-    def _OnFinishedKillThread(self, *args):
-        g_a.killInstance(self._scriptThread.getUUID())
-
+    def _OnJobFinished(self, code):
         if self.jobFinishedDelegate and self.jobFinishedDelegate.isValid():
             self.jobFinishedDelegate()()
 
-        print("Batch script <%d> finished with exit code %s." % (id(self), args[0]))
+        if LOG.bInfo:
+            LOG.info("Batch script <%d> finished with exit code %s.", id(self), code)
 
 
 class NArray(collections.UserList, NProperty):
@@ -792,7 +1236,7 @@ class NArray(collections.UserList, NProperty):
         # isinstance(data[0], int) would be true if this array is nested into an other node. If it is standalone it will not require such.
 
         if (len(data) == 2 and not isinstance(data[0], int)) or (len(data) == 1 and len(data[0]) == 2 and not isinstance(data[0], int)):
-            values = struct.unpack_from(data[0][0], data[0][1], 0)[1:-1]
+            values = getStruct(data[0][0]).unpack_from(data[0][1], 0)[1:-1]
             values = list(map(lambda x: x.decode() if hasattr(x, 'decode') else x, values))
 
         else:
@@ -821,6 +1265,114 @@ class NArray(collections.UserList, NProperty):
         return 1
 
 
+class NOrderedSet(NArray):
+    """
+    NArray of unique items, kept in insertion order. Items are stored as the keys of an OrderedDict,
+    so that membership tests and removals don't go through the whole array.
+    Serializes exactly like NArray. Items can't be placed at a given position: insert(), sort() and the like raise TypeError.
+    """
+    def __init__(self, objectType):
+        self._items = collections.OrderedDict()
+        super(NOrderedSet, self).__init__(objectType)
+
+    @property
+    def data(self):
+        # A copy: changing it doesn't change the set.
+        return list(self._items)
+
+    @data.setter
+    def data(self, items):
+        self._items = collections.OrderedDict.fromkeys(items)
+
+    def append(self, item):
+        if isinstance(item, self._typ):
+            self._items[item] = None
+        else:
+            raise TypeError("Input isn't valid. type is %s, input is %s" % (item.__class__.__name__, self._typ.__name__))
+
+    def extend(self, arr):
+        if any(map(lambda x: not isinstance(x, self._typ), arr)):
+            raise TypeError("Input isn't a single-typed list. type is %s, input is %s" % (arr.__class__.__name__, self._typ.__name__))
+        else:
+            self._items.update(collections.OrderedDict.fromkeys(arr))
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def remove(self, item):
+        del self._items[item]
+
+    def discard(self, item):
+        self._items.pop(item, None)
+
+    def pop(self, i=-1):
+        if i == -1 or i == 0:
+            return self._items.popitem(last=(i == -1))[0]
+
+        item = self[i]
+        del self._items[item]
+        return item
+
+    def clear(self):
+        self._items.clear()
+
+    def copy(self):
+        result = self.__class__(self._typ)
+        result._items = self._items.copy()
+        return result
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __getitem__(self, i):
+        if i == 0 and self._items:
+            return next(iter(self._items))
+        elif i == -1 and self._items:
+            return next(reversed(self._items))
+
+        return self.data[i]
+
+    def __delitem__(self, i):
+        del self._items[self[i]]
+
+    def _unordered(self, *args, **kwargs):
+        raise TypeError("%s items can't be placed at a given position." % self.__class__.__name__)
+
+    insert = __setitem__ = sort = reverse = __imul__ = _unordered
+
+
+class NStream(NProperty):
+    """
+    Lazy, re-iterable sequence used for DT_Iterable values. Every iteration calls the generator function again, so that items
+    are produced on demand instead of being held in memory, and several readers can each go through them.
+    """
+    def __init__(self, func=None, *args):
+        super(NStream, self).__init__()
+        self._func = func
+        self._args = args
+
+    def __iter__(self):
+        return iter(self._func(*self._args)) if self._func else iter(())
+
+    def toList(self):
+        return list(self)
+
+    def __archive__(self, Ar):
+        """
+        Serialize the items of the stream, as an NArray of the type of its first item.
+        """
+        items = self.toList()
+        arr = NArray(items[0].__class__ if items else NString)
+        arr.extend(items)
+        arr.__archive__(Ar)
+
 
 class NString(collections.UserString, NProperty):
     """
@@ -839,10 +1391,9 @@ class NString(collections.UserString, NProperty):
         :param Ar: The input archive to serialize into. Modifies the input directly.
         :type Ar: NArchive.
         """
-        encoding = '%ds' % len(self)
-        s = struct.Struct(encoding)
-        buffer = s.pack(self.data.encode())
-        Ar += (encoding, buffer)
+        # A '%ds' struct packs the encoded bytes as they are. Sized on the bytes, so that non-ASCII strings are not truncated.
+        buffer = self.data.encode()
+        Ar += ('%ds' % len(buffer), buffer)
 
     def __reader__(self, data: (list, tuple, str)):
         """
@@ -877,6 +1428,41 @@ class NString(collections.UserString, NProperty):
         return str(self)
 
 
+class NUUID(int):
+    """
+    Identity of an NObject: an immutable 128-bit integer, so it hashes and compares as cheaply as an int.
+    It only takes its string form (as in '12345678-1234-5678-1234-567812345678') when serialized or printed.
+    """
+    __slots__ = ()
+
+    def __new__(cls, value=None):
+        """
+        :param value: An int, or the string form of a UUID. A random UUID is generated if None.
+        """
+        if value is None:
+            value = int.from_bytes(os.urandom(16), 'big')
+        elif isinstance(value, (str, collections.UserString)):
+            value = uuid.UUID(str(value)).int
+        elif not 0 <= value < 1 << 128:
+            raise ValueError("%s is not a 128-bit UUID." % value)
+
+        return super(NUUID, cls).__new__(cls, value)
+
+    def __archive__(self, Ar: NArchive):
+        NString(self.toString()).__archive__(Ar)
+
+    def copy(self):
+        return self
+
+    def toString(self):
+        return str(uuid.UUID(int=self))
+
+    __str__ = toString
+
+    def __repr__(self):
+        return "NUUID('%s')" % self.toString()
+
+
 class NPoint2D(NProperty):
     """
     Npoint2D: Represents a point in 2D space.
@@ -894,7 +1480,7 @@ class NPoint2D(NProperty):
         :param Ar: The input archive to serialize into / deserialize from. Modifies the input directly.
         :type Ar: NArchive.
         """
-        s = struct.Struct('2d?')
+        s = getStruct('2d?')
         Ar += ('2d?', s.pack(self.x, self.y, self.__IsInt))
 
     def __reader__(self, data):
@@ -964,9 +1550,12 @@ class NPoint2D(NProperty):
         return [self.x, self.y]
 
     def toQPoint(self):
+        # Qt is only imported when the Ui needs it, so that headless sessions never load it.
+        from PySide2.QtCore import QPoint
         return QPoint(*map(int, self.toList()))
 
     def toQPointF(self):
+        from PySide2.QtCore import QPointF
         return QPointF(*map(float, self.toList()))
 
     @classmethod
@@ -991,7 +1580,7 @@ class NPoint(NProperty):
         self.z = z
 
     def __archive__(self, Ar):
-        s = struct.Struct('3d')
+        s = getStruct('3d')
         Ar += ('3d', s.pack(self.x, self.y, self.z))
 
     def __reader__(self, data):
@@ -1274,6 +1863,7 @@ CLASSTYPES = {str: EDataType.DT_String,
               list: EDataType.DT_Iterable,
               tuple: EDataType.DT_Iterable,
               NArray: EDataType.DT_Iterable,
+              NStream: EDataType.DT_Iterable,
               bool: EDataType.DT_Bool,
               NPoint: EDataType.DT_Point,
               NVariant: EDataType.DT_Variant,
@@ -1,6 +1,6 @@
 import inspect, warnings, json, os
 import global_accessor as ga
-from PySide2 import QtCore
+from Nodes.CoreLog import LOG
 
 
 class UCoreUtils:
@@ -29,6 +29,9 @@ class UCoreUtils:
         :param bbSize: Width and Height of the bounding box.
         :type  bbSize: Int.
         """
+        # Qt is only imported when the Ui needs it, so that headless sessions never load it.
+        from PySide2 import QtCore
+
         # Create pointer's bounding box.
         point = pointerPos
 
@@ -75,7 +78,8 @@ class UCoreUtils:
         i = frm
         while check(UCoreUtils.findBlock(s, i, dlmIn, dlmOut)):
             r = UCoreUtils.findBlock(s, i, dlmIn, dlmOut)
-            print(i)
+            if LOG.bDebug:
+                LOG.debug("findFmtArgs: block at %d", i)
             res.append(r[2])
             i = r[1] + 1
 
@@ -1,4 +1,4 @@
-import types
+import types, bisect, collections.abc
 import global_accessor as g_a
 
 #  ========================================== Class generators / Macros ==========================================
@@ -11,16 +11,146 @@ class AttrType:
     pass
 
 
+class NClassMeta(object):
+    """
+    Reflection data of a class, computed once and shared by all of its instances.
+    It only knows about members declared on the class. Attributes added to an instance are tracked with NATTR / RNATTR.
+    """
+    def __init__(self, cls):
+        # Names of the @Property methods, sorted by name.
+        self.exposed = []
+        # (attribute name, function name) of the methods, sorted by attribute name.
+        self.methods = []
+        self._getterPairs = {}
+
+        for name in dir(cls):
+            member = getattr(cls, name, None)
+            if isinstance(member, (types.FunctionType, types.MethodType)):
+                self.methods.append((name, member.__name__))
+                if getattr(member, 'propTypes', None) and getattr(member, 'extra_data', None):
+                    self.exposed.append(name)
+
+    def getterPairs(self, getter_syntax: str):
+        """
+        Get the (setter function name, getter attribute name) pairs of the class, for the given getter syntax.
+        """
+        pairs = self._getterPairs.get(getter_syntax, None)
+        if pairs is None:
+            pairs = []
+            for name, funcName in self.methods:
+                getter_name = getter_syntax.format(n=funcName).lower()
+                for otherName, otherFunc in self.methods:
+                    if otherFunc.lower() == getter_name and otherFunc != funcName:
+                        pairs.append((funcName, otherName))
+
+            self._getterPairs[getter_syntax] = pairs
+
+        return pairs
+
+
+_CLASS_META = {}
+
+
+def CLASS_META(ClassObj):
+    """
+    Get the NClassMeta of a class or class instance. It is built the first time a class is queried.
+    """
+    cls = ClassObj if isinstance(ClassObj, type) else ClassObj.__class__
+    meta = _CLASS_META.get(cls, None)
+    if meta is None:
+        meta = _CLASS_META[cls] = NClassMeta(cls)
+
+    return meta
+
+
+class NPropLayout(collections.abc.Mapping):
+    """
+    Read-only mapping of property name -> flags, as declared with NATTR.
+    A layout is shared by every object that declared the same properties with the same flags, in the same order.
+    NATTR / RNATTR move an object to the next layout, which is created once and reused by the objects that follow.
+    """
+    __slots__ = ('_flags', 'serial', '_transitions')
+
+    def __init__(self, flags=None, serial=()):
+        self._flags = flags if flags is not None else {}
+        # Sorted names of the serializable properties.
+        self.serial = serial
+        self._transitions = {}
+
+    def __getitem__(self, key):
+        return self._flags[key]
+
+    def __iter__(self):
+        return iter(self._flags)
+
+    def __len__(self):
+        return len(self._flags)
+
+    def __contains__(self, key):
+        return key in self._flags
+
+    def get(self, key, default=None):
+        return self._flags.get(key, default)
+
+    def withAttr(self, name: str, data: tuple):
+        """
+        Get the layout holding the same flags as this one, plus the given property.
+        """
+        if self._flags.get(name, None) == data:
+            return self
+
+        key = (name, data)
+        layout = self._transitions.get(key, None)
+        if layout is None:
+            flags = dict(self._flags)
+            flags[name] = data
+            serial = list(self.serial)
+            idx = bisect.bisect_left(serial, name)
+            bListed = idx < len(serial) and serial[idx] == name
+            if EAttrType.AT_Serializable in data[3:]:
+                if not bListed:
+                    serial.insert(idx, name)
+            elif bListed:
+                serial.pop(idx)
+
+            layout = self._transitions[key] = NPropLayout(flags, tuple(serial))
+
+        return layout
+
+    def withoutAttr(self, name: str):
+        """
+        Get the layout holding the same flags as this one, without the given property.
+        """
+        if name not in self._flags:
+            raise KeyError(name)
+
+        key = (name, None)
+        layout = self._transitions.get(key, None)
+        if layout is None:
+            flags = dict(self._flags)
+            del flags[name]
+            layout = self._transitions[key] = NPropLayout(flags, tuple(x for x in self.serial if x != name))
+
+        return layout
+
+
+_ROOT_LAYOUT = NPropLayout()
+# Hooks and getters are rarely registered: objects share this empty mapping until they register their first one.
+_NO_ENTRIES = types.MappingProxyType({})
+
+
 def CLASS_BODY(ClassObj, **kwargs):
-    setattr(ClassObj, '__PropFlags__', {})
-    setattr(ClassObj, '__PropHooks__', {})
-    setattr(ClassObj, '__PropGetters__', {})
+    setattr(ClassObj, '__PropFlags__', _ROOT_LAYOUT)
+    setattr(ClassObj, '__PropHooks__', _NO_ENTRIES)
+    setattr(ClassObj, '__PropGetters__', _NO_ENTRIES)
     g_a.addToGlobal(ClassObj.__class__.__name__, ClassObj.__class__)
 
 
 def CLASS_REGISTER(ClassObj, **kwargs):
     if not kwargs.get('noReferencing', False):
-        g_a.addInstance(ClassObj)
+        return g_a.addInstance(ClassObj)
+
+    return 0
 
 
 def CLASS_PROP_BODY(ClassObj):
@@ -40,35 +170,49 @@ def NATTR(ClassObj, PropName, *args: AttrType, DESC: str = '', UPDATEHOOK=None,
     :type pos: int.
     """
     if hasattr(ClassObj, '__PropFlags__'):
-        data = list(args)
-        data.insert(0, DESC)
         if UPDATEHOOK:
             assert isinstance(UPDATEHOOK, (types.MethodType, types.FunctionType))
+            # Hooks are bound to the instance, they are kept next to the shared flags rather than in them.
+            updaters = getattr(ClassObj, '__PropUpdaters__', None)
+            if updaters is None:
+                updaters = ClassObj.__PropUpdaters__ = {}
+
+            updaters[PropName] = UPDATEHOOK
+
+        elif PropName in getattr(ClassObj, '__PropUpdaters__', ()):
+            del ClassObj.__PropUpdaters__[PropName]
+
+        ClassObj.__PropFlags__ = ClassObj.__PropFlags__.withAttr(PropName, (DESC, None, pos) + args)
 
-        data.insert(1, UPDATEHOOK)
-        data.insert(2, pos)
-        ClassObj.__PropFlags__[PropName] = tuple(data)
+        if getattr(ClassObj, '__PropOrder__', None) is not None:
+            ClassObj.__PropOrder__ = None
     else:
         raise AttributeError("%s does not use the generator macro CLASS_BODY()." % ClassObj.__class__.__name__)
 
 
 def HASHOOK(ClassObj, PropName):
     if hasattr(ClassObj, '__PropFlags__'):
-        return ClassObj.__PropFlags__.get(PropName, (None, None))[1] is not None
+        return PropName in getattr(ClassObj, '__PropUpdaters__', ())
     else:
         raise AttributeError("%s does not use the generator macro CLASS_BODY()." % ClassObj.__class__.__name__)
 
 
 def GET_ATTRHOOK(ClassObj, PropName):
     if hasattr(ClassObj, '__PropFlags__'):
-        return ClassObj.__PropFlags__.get(PropName, (None, None))[1]
+        return getattr(ClassObj, '__PropUpdaters__', _NO_ENTRIES).get(PropName, None)
     else:
         raise AttributeError("%s does not use the generator macro CLASS_BODY()." % ClassObj.__class__.__name__)
 
 
 def RNATTR(ClassObj, PropName):
     if hasattr(ClassObj, '__PropFlags__'):
-        del ClassObj.__PropFlags__[PropName]
+        ClassObj.__PropFlags__ = ClassObj.__PropFlags__.withoutAttr(PropName)
+
+        if PropName in getattr(ClassObj, '__PropUpdaters__', ()):
+            del ClassObj.__PropUpdaters__[PropName]
+
+        if getattr(ClassObj, '__PropOrder__', None) is not None:
+            ClassObj.__PropOrder__ = None
     else:
         raise AttributeError("%s does not use the generator macro CLASS_BODY()." % ClassObj.__class__.__name__)
 
@@ -86,6 +230,9 @@ def REGISTER_HOOK(ClassObj, PropName, hook):
     :param hook: The delegate to bind.
     """
     if hasattr(ClassObj, '__PropHooks__'):
+        if ClassObj.__PropHooks__ is _NO_ENTRIES:
+            ClassObj.__PropHooks__ = {}
+
         ClassObj.__PropHooks__[PropName] = hook
     else:
         raise AttributeError("%s does not use the generator macro CLASS_BODY()." % ClassObj.__class__.__name__)
@@ -100,6 +247,9 @@ def REGISTER_GETTER(ClassObj, PropName: str, Getter: classmethod):
     :type Getter: method or classmethod
     """
     if hasattr(ClassObj, '__PropGetters__'):
+        if ClassObj.__PropGetters__ is _NO_ENTRIES:
+            ClassObj.__PropGetters__ = {}
+
         ClassObj.__PropGetters__[PropName] = Getter
     else:
         raise AttributeError("%s does not use the generator macro CLASS_BODY()." % ClassObj.__class__.__name__)
@@ -185,10 +335,13 @@ def Property(*PropTypes: EPropType, **kwargs):
 def ExposedMethod(funcType, **kwargs):
     """
     Decorator for methods that do not use logic from a complex node. Use this if you wish to expose Methods or Functions to the Visual Scripting.
+    Pass process=True to run the function in a worker process. It must then be a module-level function taking and returning picklable values.
     """
+    bProcess = kwargs.pop('process', False)
 
     def register_wrapper(func):
         func.__VisibleFunc__ = kwargs.get('visible', True)
+        func.__process__ = bProcess
         func.__returnValues__ = kwargs
         func.__mode__ = funcType
         return func
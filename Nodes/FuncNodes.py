@@ -1,6 +1,8 @@
 from Nodes.Core import *
 from Nodes.CoreUtils import *
-import shutil
+from Nodes.CoreLog import LOG
+from NThreads import NProcessing
+import shutil, itertools
 
 
 class Tester(NFunctionBase):
@@ -86,7 +88,8 @@ class PyScript(NFunctionBase):
             i = end
             inputs.append(name)
             bIsOutput = code[start-2] == '@' if start - 2 >= 0 else False
-            print(bIsOutput)
+            if LOG.bDebug:
+                LOG.debug("Script block %s, output: %s", name, bIsOutput)
             self._blocks.append((start, end, name, bIsOutput))
 
         attrs = map(lambda x: x.split(':'), inputs)
@@ -118,7 +121,9 @@ class PyScript(NFunctionBase):
         # finally clean up the actual script:
         cleanScript = self._cleanupStr(self._rawScript, self._blocks)
 
-        self._script.setCode(cleanScript); print(cleanScript)
+        self._script.setCode(cleanScript)
+        if LOG.bDebug:
+            LOG.debug(cleanScript)
 
     def _cleanupStr(self, rawScript, blocks):
         cleanScript = rawScript
@@ -143,6 +148,16 @@ class PyScript(NFunctionBase):
     def _get_bAsync(self):
         return self._script.getAsync()
 
+    @Property(EPropType.PT_Input, dataType=EDataType.DT_Bool, pos=3)
+    def bProcess(self, v: bool):
+        """
+        Run the script in a worker process, so that CPU-heavy scripts use all cores. Only values of the script's attributes are available to it.
+        """
+        self._script.setProcess(bool(v))
+
+    def _get_bProcess(self):
+        return self._script.getProcess()
+
 
 class BatchScript(PyScript):
     def __init__(self, funcName):
@@ -196,7 +211,9 @@ class ForEachLoop(NFunctionBase):
         super(ForEachLoop, self).__init__(funcName, None, EFuncType.FT_Callable)
 
         self._loopDelegate = DelegateSingle("loopDelegate_%s" % self.getName(), self)
+        self._chunkDelegate = DelegateMulticast("chunkDelegate_%s" % self.getName(), self)
         self._counter = []
+        self._chunkSize = 0
 
         NATTR(self, 'value', EAttrType.AT_ReadOnly, pos=3)
         self.value = NDynamicAttr('value', EDataType.DT_Variant, None, self)
@@ -204,31 +221,163 @@ class ForEachLoop(NFunctionBase):
         NATTR(self, 'index', EAttrType.AT_ReadOnly, pos=4)
         self.index = NDynamicAttr('index', EDataType.DT_Int, NInt(0), self, noInput=True)
 
+        NATTR(self, 'collect', EAttrType.AT_WriteOnly, DESC="Value to collect into results, read after each iteration.", pos=6)
+        self.collect = NDynamicAttr('collect', EDataType.DT_Variant, None, self)
+
+        NATTR(self, 'results', EAttrType.AT_ReadOnly, DESC="The collected values, one per item.", pos=7)
+        self.results = NDynamicAttr('results', EDataType.DT_Iterable, [], self, noInput=True)
+
         REGISTER_HOOK(self, 'loop', self._loopDelegate)
+        REGISTER_HOOK(self, 'chunk', self._chunkDelegate)
+
+        self.registerGetters()
 
     @Property(EPropType.PT_FuncDelegateOut, dataType=EDataType.DT_Delegate, pos=2)
     def loop(self):
         self._loopDelegate.execute()
 
+    @Property(EPropType.PT_FuncDelegateOut, dataType=EDataType.DT_Delegate, pos=9)
+    def chunk(self):
+        """
+        Fired each time chunkSize items went through the loop, with results holding the values collected for these items.
+        """
+        self._chunkDelegate.execute()
+
     @Property(EPropType.PT_Input, dataType=EDataType.DT_Iterable, pos=1)
-    def iterable(self, it: (list, tuple, collections.UserList, ByRefVar)):
+    def iterable(self, it: (list, tuple, collections.UserList, ByRefVar, NStream)):
         if isinstance(it, ByRefVar):
             it = it.get()
 
         self._counter = map(lambda x: NVariant(x), it)
 
+    @Property(EPropType.PT_Input, dataType=EDataType.DT_Int, pos=8)
+    def chunkSize(self, v: int):
+        """
+        Number of items consumed at once. With 0, results holds the values of every item once the loop is done.
+        Otherwise, results only holds the current chunk, which bounds memory for large or streamed inputs.
+        """
+        self._chunkSize = max(int(v), 0)
+
+    def _get_chunkSize(self):
+        return self._chunkSize
+
     @Property(EPropType.PT_FuncDelegateIn, dataType=EDataType.DT_Delegate, pos=0)
     def execute(self):
         self.evaluate()
+
+        body = self._compileBody()
+        items = iter(self._counter)
+        if body is not None:
+            # The body is made of pure exposed methods only: evaluate it over whole chunks, without going through the attributes.
+            idx = 0
+            last = None
+            for chunk in iter(lambda: list(itertools.islice(items, self._chunkSize or None)), []):
+                results = [body(item, idx + i) for i, item in enumerate(chunk)]
+                idx += len(chunk)
+                last = chunk[-1]
+                self._emitChunk(results)
+
+            if last is not None:
+                self.value.set(last)
+                self.index.set(idx - 1)
+            else:
+                self.results.set([])
+
+            self.then()
+            return
+
+        bCollect = self.collect.hasConnection()
+        results = []
+        bEmitted = False
         idx = 0
-        for item in self._counter:
+        for item in items:
             self.value.set(item)
             self.index.set(idx)
             self.loop()
+            if bCollect:
+                results.append(self.collect.get())
             idx += 1
 
+            if self._chunkSize and idx % self._chunkSize == 0:
+                self._emitChunk(results)
+                results = []
+                bEmitted = True
+
+        if results or not bEmitted:
+            self._emitChunk(results)
+
         self.then()
 
+    def _emitChunk(self, results):
+        self.results.set(results)
+        if self._chunkSize:
+            self.chunk()
+
+    def _compileBody(self):
+        """
+        Turn the loop body into a single function of (value, index), if possible.
+        This requires nothing to be bound to the loop output, and the collected value to only depend on the loop's value and index,
+        constants, and pure exposed methods running in this process.
+        :return: The function, or None if the body can't be vectorized.
+        """
+        if len(self._loopDelegate._functions) != 0 or not self.collect.hasConnection():
+            return None
+
+        program = []
+        slots = {}
+
+        def source(attr):
+            up = attr.getUpstream()
+            check = attr.check
+            if up is None:
+                const = attr.get()
+                return lambda v, i, r: const
+            elif up is self.value:
+                return lambda v, i, r: check(v)
+            elif up is self.index:
+                return lambda v, i, r: check(i)
+
+            node = up._owner
+            if not isinstance(node, NFunctionWrapper) or node.type_() != EFuncType.FT_Pure or getattr(node.getFunc(), '__process__', False):
+                return None
+
+            k = visit(node)
+            if k is None:
+                return None
+
+            o = node.outputs.index(up)
+            return lambda v, i, r: check(r[k][o])
+
+        def visit(node):
+            if id(node) in slots:
+                return slots[id(node)]
+
+            slots[id(node)] = None  # Guards against cycles.
+            args = [source(attr) for attr in node.inputs]
+            if any(a is None for a in args):
+                return None
+
+            program.append((node.getFunc(), args, [attr.check for attr in node.outputs]))
+            slots[id(node)] = len(program) - 1
+            return slots[id(node)]
+
+        final = source(self.collect)
+        if final is None:
+            return None
+
+        def body(v, i):
+            r = []
+            for func, args, outs in program:
+                res = func(*[a(v, i, r) for a in args])
+                if len(outs) == 1:
+                    r.append((outs[0](res),))
+                else:
+                    r.append(tuple(c(x) for c, x in zip(outs, res)))
+
+            return final(v, i, r)
+
+        return body
+
     @Property(EPropType.PT_FuncDelegateOut, dataType=EDataType.DT_Delegate, pos=5)
     def then(self):
         super(ForEachLoop, self).then()
@@ -299,22 +448,26 @@ class ReadDir(NFunctionBase):
 
     @Property(EPropType.PT_FuncDelegateIn, dataType=EDataType.DT_Delegate, pos=0)
     def execute(self):
-        self.result.set(self.goThroughDir(self.directory.get()))
+        # The files are listed lazily, as the result is iterated.
+        self.result.set(NStream(self.iterDir, str(self.directory.get())))
         self.then()
 
     def goThroughDir(self, path):
-        p = os.listdir(str(path))
-        files = []
-        for item in p:
-            fp = "%s\\%s" % (path, item)  # Parse the full path for the current item.
-            # Check if the item we're going through is a directory or a file.
-            if os.path.isfile(fp):
-                files.append(NString(fp))
+        return list(self.iterDir(path))
 
-            elif self._bRecursive and os.path.isdir(fp):
-                files.extend(self.goThroughDir(fp))
+    def iterDir(self, path):
+        """
+        Generator yielding the full path of each file in a directory, as NString.
+        """
+        with os.scandir(str(path)) as it:
+            for entry in it:
+                fp = "%s\\%s" % (path, entry.name)  # Parse the full path for the current item.
+                # Check if the item we're going through is a directory or a file.
+                if entry.is_file():
+                    yield NString(fp)
 
-        return files
+                elif self._bRecursive and entry.is_dir():
+                    yield from self.iterDir(fp)
 
 
 class RenameFile(NFunctionBase):
@@ -432,12 +585,15 @@ class NFunctionWrapper(NFunctionBase):
         self._methodRef = baseMethod
         self.inputs = []
         self.outputs = []
+        # Inputs passed by reference. Callable methods may change what they point to in place.
+        self._refInputs = []
 
         self.buildNodeFromFunc()
 
     def buildNodeFromFunc(self):
         sig = inspect.signature(self._methodRef)
-        print(sig.return_annotation)
+        if LOG.bDebug:
+            LOG.debug("%s returns %s", self._methodRef.__name__, sig.return_annotation)
         null = inspect.Parameter.empty
         for k, v in sig.parameters.items():
             name = k
@@ -445,12 +601,14 @@ class NFunctionWrapper(NFunctionBase):
             default = v.default
             valueType = CLASSTYPES[typ] if typ is not null else EDataType.DT_Variant
             defaultValue = default if default is not null else None
-            hook = self.execute if self._methodRef.__mode__ == EFuncType.FT_Pure else None
-            newAttr = NDynamicAttr(name, valueType, defaultValue, self, EvaluationHook=hook)
+            # Inputs need no hook: changing them invalidates the outputs, which re-execute when read.
+            newAttr = NDynamicAttr(name, valueType, defaultValue, self)
 
             NATTR(self, name, EAttrType.AT_WriteOnly, EAttrType.AT_Serializable)
             setattr(self, name, newAttr)
             self.inputs.append(newAttr)
+            if valueType == EDataType.DT_AttrRef:
+                self._refInputs.append(newAttr)
 
         for k, v in self._methodRef.__returnValues__.items():
             valueType = CLASSTYPES[v]
@@ -464,7 +622,18 @@ class NFunctionWrapper(NFunctionBase):
     @Property(EPropType.PT_FuncDelegateIn, dataType=EDataType.DT_Delegate)
     def execute(self):
         vals = map(lambda x: x.get(bFromCaller=True), self.inputs)
-        res = self._methodRef(*vals)
+        if getattr(self._methodRef, '__process__', False):
+            # Wait for the worker process, so that the outputs are set before the next node runs.
+            res = NProcessing.getProcessPool().submit(self._methodRef, *vals).result()
+        else:
+            res = self._methodRef(*vals)
+
+        if self._methodRef.__mode__ != EFuncType.FT_Pure:
+            # The referenced values may have been changed in place, which no set() reports: every attribute reading them goes stale.
+            for attr in self._refInputs:
+                upstream = attr.getUpstream()
+                if upstream is not None:
+                    upstream._invalidateDownstream()
 
         j = self.outputs.__len__()
         if j == 1:
@@ -504,7 +673,8 @@ class FormatString(NFunctionBase):
 
     def applyAttrs(self):
         newStr = self.source.get(bFromCaller=True).toString()
-        print(newStr, self._string)
+        if LOG.bDebug:
+            LOG.debug("%s %s", newStr, self._string)
         if newStr == self._string:
             return
 
@@ -578,6 +748,7 @@ class MakeIterable(Iterable):
         self.onAttributeChanged.execute(name, EAttrChange.AC_Added, typ=t, mode=1)
         self.iterable.insert(self._idx, new.get())
         self._idx += 1
+        self.iterableRef.invalidate()
 
     @Property(EPropType.PT_Internal)
     def removeItem(self):
@@ -588,6 +759,7 @@ class MakeIterable(Iterable):
             delattr(self, name)
             self._content.pop(self._idx)
             self.onAttributeChanged.execute(name, EAttrChange.AC_Removed)
+            self.iterableRef.invalidate()
 
     def refresh(self):
         """
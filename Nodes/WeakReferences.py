@@ -1,4 +1,5 @@
 import weakref
+import global_accessor as GA
 
 
 class NWeakRef(weakref.ref):
@@ -25,4 +26,36 @@ class NWeakMethod(weakref.WeakMethod):
 
 class NFinalizer(weakref.finalize):
     def __init__(self, obj, callback, *args, **kwargs):
-        super(NFinalizer, self).__init__(obj, callback, *args, **kwargs)
\ No newline at end of file
+        super(NFinalizer, self).__init__(obj, callback, *args, **kwargs)
+
+
+class NHandleRef(object):
+    """
+    Reference to a registered object through its registry handle. Like a weak reference, it doesn't keep the object alive,
+    and it also stops resolving once the object is unregistered.
+    """
+    __slots__ = ('_handle',)
+
+    def __init__(self, handle: int):
+        self._handle = handle
+
+    def __call__(self):
+        return GA.resolveHandle(self._handle)
+
+    def getHandle(self):
+        return self._handle
+
+    def isValid(self):
+        return self() is not None
+
+
+def objectRef(ob, callback=None):
+    """
+    Reference an object without owning it: registered objects are referenced by handle, anything else weakly.
+    :return: An NHandleRef or an NWeakRef, both called to get the object.
+    """
+    handle = ob.getHandle() if callback is None and hasattr(ob, 'getHandle') else 0
+    if handle and GA.resolveHandle(handle) is ob:
+        return NHandleRef(handle)
+
+    return NWeakRef(ob, callback)
@@ -1,5 +1,6 @@
 from Nodes.Core import *
 from Nodes.CoreUtils import *
+from Nodes.CoreLog import LOG
 import json
 
 
@@ -62,7 +63,9 @@ class Seemlessman(NFunctionBase):
 
                 value = cnt
 
-            print(value)
+            if LOG.bDebug:
+                LOG.debug('Seemlessman %s: %s', item, value)
+
             outCmdArgs += " %s" % str(value)
 
         cmd = self._cmdFmt.format(sm=self._SeemlessmanBinary, flag=self._flagCmd, cmd=outCmdArgs)
@@ -1,11 +1,210 @@
-import warnings, collections
-
-import memory_handling as mh
+import warnings, weakref, threading
+from uuid import UUID
+from Nodes.CoreLog import LOG
 
 ActiveClasses = {}
-classInstances = {}
 functionClasses = {}
 
+# A handle packs a slot index in its low bits and the generation of that slot above them.
+_SLOT_BITS = 32
+_SLOT_MASK = (1 << _SLOT_BITS) - 1
+
+
+def _key(uuid):
+    """
+    Get the registry key of a UUID: the UUID itself for NUUIDs and ints, the parsed integer for strings.
+    :return: The key, None if uuid is not a UUID.
+    """
+    if isinstance(uuid, int):
+        return uuid
+
+    try:
+        return UUID(str(uuid)).int
+    except ValueError:
+        return None
+
+
+class NRegistry(object):
+    """
+    Registry of the live NObjects, by integer UUID. It also indexes them by name and by class,
+    so that looking objects up by name or type does not go through every registered object.
+    Objects are weakly referenced: they leave the registry on their own once they are collected.
+    Each registered object gets an integer handle. A slot's generation changes when its object leaves,
+    so stale handles resolve to None instead of to whatever object reuses the slot.
+    The registry is locked, since objects may be created and collected on worker threads, such as the branches of an NBranchScheduler.
+    """
+    def __init__(self):
+        # Reentrant: collecting an object while the lock is held runs its weak reference callback on the same thread.
+        self._lock = threading.RLock()
+        # UUID -> handle.
+        self._instances = {}
+        # Name -> {handle: weak reference}, in registration order.
+        self._byName = {}
+        # Class -> {handle: weak reference}, in registration order.
+        self._byType = {}
+        # Slot -> [generation, weak reference, uuid, name, class].
+        self._slots = []
+        self._free = []
+
+    def __len__(self):
+        return len(self._instances)
+
+    def add(self, obj):
+        """
+        Register an object, replacing any object registered under the same UUID.
+        :return: The handle of the object.
+        """
+        with self._lock:
+            key = obj.getUUID()
+            name = obj.getName().toString()
+            previous = self._instances.get(key, None)
+            if previous is not None:
+                self._release(previous)
+
+            if self._free:
+                slot = self._free.pop()
+                entry = self._slots[slot]
+            else:
+                slot = len(self._slots)
+                entry = [1, None, None, None, None]
+                self._slots.append(entry)
+
+            handle = (entry[0] << _SLOT_BITS) | slot
+            ref = weakref.ref(obj, lambda ref: self._expire(handle))
+            entry[1] = ref
+            entry[2] = key
+            entry[3] = name
+            entry[4] = obj.__class__
+
+            self._instances[key] = handle
+            self._byName.setdefault(name, {})[handle] = ref
+            self._byType.setdefault(obj.__class__, {})[handle] = ref
+            return handle
+
+    def _entry(self, handle):
+        slot = handle & _SLOT_MASK
+        if slot < len(self._slots):
+            entry = self._slots[slot]
+            if entry[0] == handle >> _SLOT_BITS:
+                return entry
+
+        return None
+
+    def resolve(self, handle):
+        """
+        Get the object a handle was given to.
+        :return: The object, None if it was collected or unregistered since.
+        """
+        with self._lock:
+            entry = self._entry(handle)
+            return entry[1]() if entry is not None else None
+
+    def get(self, uuid):
+        with self._lock:
+            handle = self._instances.get(_key(uuid), None)
+            return self.resolve(handle) if handle is not None else None
+
+    def remove(self, uuid):
+        """
+        Unregister an object.
+        :return: The object, None if it wasn't registered.
+        """
+        with self._lock:
+            handle = self._instances.get(_key(uuid), None)
+            if handle is None:
+                return None
+
+            obj = self.resolve(handle)
+            self._release(handle)
+            return obj
+
+    def _expire(self, handle):
+        # Weak reference callback: the object was collected without being unregistered.
+        with self._lock:
+            if self._entry(handle) is not None:
+                self._release(handle)
+
+    def _release(self, handle):
+        entry = self._entry(handle)
+        key, name, cls = entry[2], entry[3], entry[4]
+        if self._instances.get(key, None) == handle:
+            del self._instances[key]
+
+        named = self._byName[name]
+        del named[handle]
+        if not named:
+            del self._byName[name]
+
+        typed = self._byType[cls]
+        del typed[handle]
+        if not typed:
+            del self._byType[cls]
+
+        entry[0] += 1
+        entry[1] = entry[2] = entry[3] = entry[4] = None
+        self._free.append(handle & _SLOT_MASK)
+
+    def findByName(self, name: str):
+        with self._lock:
+            for ref in self._byName.get(str(name), {}).values():
+                obj = ref()
+                if obj is not None:
+                    return obj
+
+            return None
+
+    def findByType(self, classType):
+        """
+        Get the registered instances of a class, including instances of its subclasses.
+        """
+        with self._lock:
+            result = []
+            for cls, refs in list(self._byType.items()):
+                if issubclass(cls, classType):
+                    result.extend([obj for obj in [ref() for ref in list(refs.values())] if obj is not None])
+
+            return result
+
+    def rename(self, obj):
+        """
+        Move an object to its current name in the name index. Called when the object is renamed.
+        """
+        with self._lock:
+            handle = self._instances.get(obj.getUUID(), None)
+            if handle is None or self.resolve(handle) is not obj:
+                return
+
+            entry = self._entry(handle)
+            name = obj.getName().toString()
+            previous = entry[3]
+            if previous != name:
+                named = self._byName[previous]
+                del named[handle]
+                if not named:
+                    del self._byName[previous]
+
+                entry[3] = name
+                self._byName.setdefault(name, {})[handle] = entry[1]
+
+    def rekey(self, oldKey, obj):
+        """
+        Move an object registered under oldKey to its current UUID. Its handle doesn't change.
+        """
+        with self._lock:
+            handle = self._instances.pop(_key(oldKey))
+            key = obj.getUUID()
+            previous = self._instances.get(key, None)
+            if previous is not None and previous != handle:
+                self._release(previous)
+
+            self._instances[key] = handle
+            self._entry(handle)[2] = key
+
+
+registry = NRegistry()
+# UUID -> handle map of the registry. Read-only: use the functions below to modify it.
+classInstances = registry._instances
+
 
 def addToGlobal(typ, classRef):
     global ActiveClasses
@@ -19,46 +218,56 @@ def findClass(typ):
 
 
 def addInstance(obj):
-    global classInstances
-    print('registering new object: %s' % obj)
-    classInstances[obj.getUUID().toString()] = obj
+    if LOG.bDebug:
+        LOG.debug('registering new object: %s', obj)
+    return registry.add(obj)
 
 
 def getInstance(uuid):
-    global classInstances
-    return classInstances.get(str(uuid), None)
+    return registry.get(uuid)
+
+
+def resolveHandle(handle: int):
+    return registry.resolve(handle)
+
+
+def removeInstance(uuid):
+    """
+    Unregister an object without tearing it down.
+    :return: The object, None if it wasn't registered.
+    """
+    return registry.remove(uuid)
 
 
 def killInstance(uuid):
-    global classInstances
-    obj = classInstances[uuid]
-    print("Removing %s from registered objects." % obj)
-    del classInstances[uuid]
+    """
+    Unregister an object and destroy it, along with the objects it owns. See NObject.destroy().
+    """
+    obj = removeInstance(uuid)
+    if obj is None:
+        warnings.warn("%s no longer exists or is not valid." % uuid, RuntimeWarning)
+        return
 
-    refs = mh.getReferrers(obj)
-    mh.clearReferences(refs)
+    if LOG.bInfo:
+        LOG.info("Removing %s from registered objects.", obj)
+    obj.destroy()
 
 
 def getInstanceByName(name: str):
-    global classInstances
-    for v in classInstances.values():
-        if v.getName().toString() == name:
-            return v
+    return registry.findByName(name)
 
 
-def swapInstanceKey(olduuid):
-    global classInstances
-    assert isinstance(olduuid, (str, collections.UserString))
+def renameInstance(obj):
+    registry.rename(obj)
 
-    ptr = classInstances.get(str(olduuid), None)
 
-    if ptr:
-        classInstances[ptr.getUUID().toString()] = ptr
-        classInstances.pop(olduuid)
+def swapInstanceKey(olduuid):
+    ptr = registry.get(olduuid)
+
+    if ptr is not None:
+        registry.rekey(olduuid, ptr)
     else:
         warnings.warn("%s no longer exists or is not valid." % olduuid, RuntimeWarning)
-        classInstances[olduuid] = None
-        del classInstances[olduuid]
 
 
 def registerFunction(function):
@@ -71,10 +280,4 @@ def registerFunction(function):
 
 
 def objectInstances(classType):
-    global classInstances
-    result = []
-    for k, v in classInstances.items():
-        if isinstance(v, classType):
-            result.append(v)
-
-    return result
+    return registry.findByType(classType)
@@ -0,0 +1,37 @@
+import unittest
+
+from Nodes import FuncNodes
+from Nodes.CoreProperties import NInt
+
+
+class ForEachLoopTest(unittest.TestCase):
+
+    @staticmethod
+    def _run(bVectorized: bool):
+        """
+        Run a loop that collects index + 100 for each item.
+        :param bVectorized: Whether the body is left pure, so that it runs over the whole batch.
+        :return: The collected values.
+        """
+        loop = FuncNodes.ForEachLoop('forEach')
+        add = FuncNodes.NFunctionWrapper('add', FuncNodes.add)
+        loop.index.connect(add, 'a')
+        add.b.set(100)
+        add.outputs[0].connect(loop, 'collect')
+
+        if not bVectorized:
+            # Anything bound to the loop output forces the per-item path.
+            loop._loopDelegate.bindFunction(FuncNodes.Tester('noop'), 'execute')
+
+        loop.iterable([NInt(5), NInt(6), NInt(7)])
+        loop.execute()
+        return [x.get() if hasattr(x, 'get') else x for x in loop.results.get()]
+
+    def test_vectorizedMatchesPerItem(self):
+        perItem = self._run(False)
+        self.assertEqual(perItem, [100, 101, 102])
+        self.assertEqual(self._run(True), perItem)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+
+from Nodes import FuncNodes
+from Nodes.Core import NWorld, EFuncType
+from Nodes.CoreProperties import ByRefVar, NVariant
+from Nodes.Decorators import ExposedMethod
+
+
+@ExposedMethod(EFuncType.FT_Pure, last=NVariant)
+def lastItem(iterable: ByRefVar):
+    items = iterable.get()
+    return items[-1] if items else None
+
+
+class ByReferenceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.iterable = FuncNodes.MakeIterable('iterable')
+        self.add = FuncNodes.NFunctionWrapper('add', FuncNodes.iterable_Add)
+        self.clear = FuncNodes.NFunctionWrapper('clear', FuncNodes.iterable_Clear)
+        self.last = FuncNodes.NFunctionWrapper('last', lastItem)
+        for node in (self.add, self.clear, self.last):
+            NWorld.connectNodes(self.iterable, 'iterableRef', node, 'iterable')
+
+    def test_readsSeeInPlaceChanges(self):
+        """
+        Pure nodes reading a list by reference must not serve the value cached before the list was changed in place.
+        """
+        results = []
+        for i in range(3):
+            self.add.value.set(i)
+            self.add.execute()
+            results.append(self.last.last.get())
+
+        self.assertEqual(results, [0, 1, 2])
+
+        self.clear.execute()
+        self.assertIsNone(self.last.last.get().get())
+
+
+if __name__ == '__main__':
+    unittest.main()